@@ -24,24 +24,67 @@
 #
 
 # Python built-in modules
-import sys
+import errno
 import os
+import itertools
+import logging
+import Queue
+import threading
+import time
 
 # Project modules
 import videofile
 import streams
+import plugins
+import stats
 
-__all__ = ['VideoParser']
+__all__ = ['VideoParser', 'ParseError', 'LimitError']
 __author__ = "Michael van Tellingen <michaelvantellingen at gmail.com>"
 
 from videoparser.version import version as __version__
 
+# The diagnostics of the parsers are logged to the videoparser logger and its
+# children, nothing is output unless the application configures logging
+log = logging.getLogger(__name__)
+log.addHandler(logging.NullHandler())
+
 # List of plugins
 parser_plugins = ['asf', 'matroska', 'avi', 'realmedia', 'quicktime']
 
+# Number of bytes read from the start of a file to match the signatures of the
+# plugins
+header_size = 4096
+
+# Number of files handed to a parse_files worker at once, at most and when the
+# number of files isn't known up front
+max_chunksize = 64
+default_chunksize = 16
+
+# Seconds between the checks of parse_files for chunks which failed without
+# a result
+chunk_poll_interval = 1.0
+
+# Number of threads of the pool used by VideoParser.parse_file_async, which
+# limits the number of files parsed at the same time
+async_workers = 16
+
+
+class ParseError(Exception):
+	""" Error reported by parse_files for a file which could not be parsed.
+		stats is the stats.ParseStats of the failed parse when the
+		VideoParser collects them, else None. """
+	
+	stats = None
+
+
+# Raised when a file exceeds the limits given to VideoParser
+LimitError = streams.LimitError
+
+
 class VideoParser(object):
-	""" The VideoParser object will first guess the required parser based on
-		the file extension. If that fails it will try each available parser.
+	""" The VideoParser object selects the parsers for a file by matching the
+		signatures of the plugins against the first bytes of the file. When
+		more than one parser matches the file extension decides the order.
 		
 		On success it will return the videofile.VideoFile object
 	
@@ -53,85 +96,566 @@ class VideoParser(object):
 				print video_stream.resolution
 				print video_stream.codec"""
 
-	def __init__(self):
-		""" Initialise the VideoParser object."""
-		self.parsers = []
-		self._import_parsers()
-	
-	def _import_parsers(self):
-		""" Import the specified parsers in the global list parser_plugins. """
-		# Import the parsers
-		for plugin_filename in parser_plugins:
-			try:
-				module = __import__("videoparser.plugins." + plugin_filename,
-									None, None, "plugins")
-			except ImportError, err:
-				raise
-				print "Unable to open parser module '%s'" % plugin_filename 
-				continue
-		
-			# Create parser object
-			try:
-				parser = module.Parser()
-			except AttributeError, err:
-				print "Invalid parser plugin: %s" % err
-				continue
+	def __init__(self, cache=None, dedup=None, max_element_size=None,
+				 byte_budget=None, stats=False, tracer=None):
+		""" Initialise the VideoParser object. The plugins are looked up in
+			the process wide plugins.registry, their modules are only
+			imported when a file needs them.
 			
-			self.parsers.append(parser)
-
+			The results are looked up in and stored to the cache when given,
+			a cache.ParseCache or cache.MemoryCache. A result of None, no
+			matching parser, is stored as well.
+			
+			Copies of files which were parsed before are recognised by a
+			fingerprint of their header when dedup, a cache.DedupCache, is
+			given.
+			
+			max_element_size and byte_budget limit the memory used to parse
+			a file. An element, like an atom or a header object, larger than
+			max_element_size bytes isn't read and the parsers don't read more
+			than byte_budget bytes of a file, from disk, a pipe or memory, a
+			LimitError is raised instead. Element
+			sizes which don't fit in their parent or the file always raise a
+			LimitError. parse_files reports these as a ParseError.
+			
+			When stats is True the I/O of each parse and the time spent in
+			every plugin which was tried are collected in a stats.ParseStats
+			object, the stats of the resulting VideoFile.
+			
+			A tracing.Tracer given as tracer records a span for every parser
+			which is tried on a file and for every element it visits. The
+			worker processes of parse_files don't share it, tracing needs the
+			'thread' mode."""
+		self.plugins = [plugins.registry[name] for name in parser_plugins]
+		self.cache = cache
+		self.dedup = dedup
+		self.max_element_size = max_element_size
+		self.byte_budget = byte_budget
+		self.stats = stats
+		self.tracer = tracer
 	
-	def parse_file(self, filename):
+	def get_parsers(self):
+		""" Return the Parser objects of all plugins, importing them. """
+		return [plugin.get_parser() for plugin in self.plugins]
+	parsers = property(fget=get_parsers)
+	
+	def parse_file(self, filename, fields=None):
 		""" Parse the given file and return a videofile.VideoFile object on
 			success or None when there was a parsing error or no matching
-			parser was found. """
+			parser was found.
 			
-		video = videofile.VideoFile()
-
-		filetype = filename[filename.rindex(os.extsep)+1:]
-		# Guess on the extension which parser to use
-		for parser in self.parsers:
-			if filetype in parser._file_types:
-				break
-			parser = None
+			When fields, a set of stream field names as used by to_dict() of
+			the streams, is given the plugins skip the parts of the file
+			which none of these fields depend on. The other fields may be
+			missing from the result. Such partial results are not stored in
+			the caches.
+			
+			Example:
+				video = parser.parse_file("video.mov",
+										  fields=['codec', 'width', 'height'])"""
+		fields = _check_fields(fields)
+		if self.cache is None:
+			return self._parse_file(filename, fields)
+		
+		hits, misses = self.cache.lookup([filename])
+		if filename in hits:
+			return hits[filename]
+		
+		video = self._parse_file(filename, fields)
+		if misses[filename] is not None and fields is None:
+			self.cache.store(misses[filename], video)
+		return video
+	
+	def parse_bytes(self, data, filename='', fields=None):
+		""" Parse a file held in memory, data is a string, memoryview,
+			bytearray or other object supporting the buffer interface. The
+			data is not copied. The optional filename is only used to order
+			the parsers by extension and in messages. fields and the result
+			are the same as for parse_file. """
+		fields = _check_fields(fields)
+		if not len(data):
+			return None
+		
+		stream = streams.factory.create_stringstream(data,
+													 streams.endian.little)
+		try:
+			return self._parse_stream(stream, filename, fields)
+		finally:
+			stream.close()
+	
+	def parse_fileobj(self, fileobj, size=None, filename=None,
+					  seekable=None, fields=None):
+		""" Parse a file object, size is the size of the file when known. The
+			file object is not closed. fields and the result are the same as
+			for parse_file.
+			
+			A seekable file object is parsed from its start. A file object
+			which can't seek, like a pipe or an upload, is parsed from its
+			current position in a forward only mode: data which isn't needed
+			is read and discarded, and the parsing stops as soon as the
+			information is found. For a MP4 with the moov atom first, a
+			Matroska, AVI or ASF file that is after the headers. seekable
+			is detected when it's not given. """
+		fields = _check_fields(fields)
+		if filename is None:
+			filename = getattr(fileobj, 'name', '')
+		if seekable is None:
+			seekable = _is_seekable(fileobj)
+		
+		if seekable:
+			stream = streams.factory.create_fileobjstream(
+				fileobj, streams.endian.little, size)
+		else:
+			stream = streams.factory.create_forwardstream(
+				fileobj, streams.endian.little, size)
 		
-		guessed_parser = parser
-		if guessed_parser and self._parse_file_with(filename, parser, video):
-			return video
+		try:
+			if not stream.bytes_left():
+				return None
+			return self._parse_stream(stream, filename, fields)
+		finally:
+			stream.detach()
+	
+	def _parse_file(self, filename, fields=None):
+		# The file is opened once, the stream is shared by all parsers which
+		# are tried. The start of the file stays in the read-ahead window of
+		# the stream, so it's only read once.
+		try:
+			stream = streams.factory.create_filestream(filename,
+													   streams.endian.little)
+		except IOError, err:
+			log.warning("Unable to open '%s': %s", filename, err)
+			return None
 		
-		# Don't try other parsers
-		#return None
+		try:
+			return self._parse_stream(stream, filename, fields)
+		finally:
+			stream.close()
 	
-		# Try all parsers then
-		for parser in self.parsers:
+	def _parse_stream(self, stream, filename, fields=None):
+		""" Parse the stream with the plugins matching its header. """
+		parse_stats = None
+		if self.stats:
+			parse_stats = stats.ParseStats()
+			stream.set_stats(parse_stats)
+		
+		tracer = self.tracer
+		if tracer is not None:
+			stream.set_tracer(tracer)
+		
+		video = videofile.VideoFile()
+		header = stream.read(header_size)
+		
+		# The header which selects the plugins isn't counted to the budget,
+		# only what the plugins read
+		if self.max_element_size is not None or self.byte_budget is not None:
+			stream.set_limits(streams.Limits(self.max_element_size,
+											 self.byte_budget))
+		
+		for plugin in self._find_plugins(filename, header):
+			parser = plugin.get_parser()
 			
-			# Don't parse the file twice with the same parser
-			if parser == guessed_parser:
-				continue
+			fingerprint = None
+			if self.dedup is not None and not stream.forward_only:
+				fingerprint = self._fingerprint(stream, plugin, parser)
+				if fingerprint is not None:
+					copy = self.dedup.get(fingerprint)
+					if copy is not None:
+						copy.set_stats(parse_stats)
+						return copy
 			
-			if self._parse_file_with(filename, parser, video):
+			start = time.time()
+			if parse_stats is not None:
+				cpu_start = time.clock()
+			if tracer is not None:
+				span = tracer.begin(plugin.name, 'videoparser', 0,
+									stream.get_size(), filename=filename)
+			stream.seek(0)
+			success = False
+			try:
+				success = self._parse_file_with(filename, stream, parser,
+												video, fields)
+			except Exception, err:
+				# The stats of the failed parse go with the error, parse_files
+				# passes them on in its ParseError
+				if parse_stats is not None:
+					err.stats = parse_stats
+				raise
+			finally:
+				if tracer is not None:
+					tracer.end(span, success=success)
+				if parse_stats is not None:
+					parse_stats.add_attempt(plugin.name, success,
+											time.time() - start,
+											time.clock() - cpu_start)
+			if success:
+				video.set_parse_time(time.time() - start)
+				video.set_stats(parse_stats)
+				if fingerprint is not None and fields is None:
+					self.dedup.put(fingerprint, video, video.parse_time)
 				return video
-	
+		
 		return None
 	
-	def _parse_file_with(self, filename, parser, video):
+	def _fingerprint(self, stream, plugin, parser):
+		""" Return the fingerprint of the file for the dedup cache, or None
+			when the parser can't make sense of the file or it exceeds the
+			limits. """
+		try:
+			stream.seek(0)
+			stream.set_endianess(parser._endianess)
+			return self.dedup.fingerprint(stream, plugin.name,
+										  parser.fingerprint_regions(stream))
+		except (AssertionError, LimitError):
+			return None
+	
+	def parse_files(self, filenames, workers=None, mode='process',
+					chunksize=None):
+		""" Parse the given files with a pool of workers and yield a
+			(filename, result) tuple for each file as soon as it is done, in
+			no particular order. The result is a videofile.VideoFile object,
+			None when no matching parser was found or a ParseError when the
+			parsing failed, one bad file does not stop the others. The files
+			of a worker process which dies get a ParseError as well.
 			
+			The mode is either 'process' for a pool of worker processes,
+			each with its own VideoParser, or 'thread' for a pool of threads
+			sharing this VideoParser. The number of workers defaults to the
+			number of CPUs. The dedup cache needs the 'thread' mode, the
+			worker processes don't share it, a ValueError is raised when it
+			is given with the 'process' mode.
+			
+			The filenames may be any iterable, it is consumed while the files
+			are parsed and only a few chunks per worker are queued at a time,
+			so a generator of millions of files takes constant memory.
+		
+			Example:
+				parser = VideoParser()
+				for filename, video in parser.parse_files(filenames):
+					if isinstance(video, ParseError):
+						print "Failed:", filename, video"""
+		# Imported here, most users never need a pool
+		import multiprocessing
+		
+		if mode not in ('process', 'thread'):
+			raise ValueError("Invalid mode %r, expected 'process' or "
+							 "'thread'" % mode)
+		if mode == 'process' and self.dedup is not None:
+			raise ValueError("The dedup cache needs the 'thread' mode, the "
+							 "worker processes don't share it")
+		
+		if workers is None:
+			workers = multiprocessing.cpu_count()
+		if chunksize is None:
+			if hasattr(filenames, '__len__'):
+				chunksize = len(filenames) // (workers * 4)
+			else:
+				chunksize = default_chunksize
+			chunksize = max(1, min(max_chunksize, chunksize))
+		
+		return self._iter_results(filenames, workers, mode, chunksize)
+	
+	def parse_file_async(self, filename, callback=None):
+		""" Parse the file on a thread of a process wide pool and return a
+			multiprocessing.pool.AsyncResult for the (filename, result)
+			tuple, the result is the same as for parse_files. When given,
+			callback is called with the tuple from the pool thread.
+			
+			At most async_workers files are parsed at the same time, which
+			keeps the waiting on storage with a high latency out of the
+			caller. For a batch use parse_files with the 'thread' mode.
+		
+			Example:
+				result = parser.parse_file_async("video.mkv")
+				...
+				filename, video = result.get()"""
+		return _get_async_pool().apply_async(self._parse_one, (filename,),
+											 callback=callback)
+	
+	def _iter_results(self, filenames, workers, mode, chunksize):
+		""" Hand the files in chunks to a pool and yield the results, at most
+			two chunks per worker are queued. Files in the cache are not
+			handed to the pool. The pool is stopped when the caller stops
+			iterating early. """
+		import multiprocessing
+		import multiprocessing.pool
+		import multiprocessing.queues
+		
+		# The indexes of the chunks which are done, and the chunks which
+		# are queued or being parsed by index. The worker processes report
+		# the chunks they start with their pid on started, a SimpleQueue
+		# writes it before the worker goes on.
+		done = Queue.Queue()
+		pending = {}
+		started = None
+		pool = None
+		
+		try:
+			for index, chunk in enumerate(_split(filenames, chunksize)):
+				misses = {}
+				if self.cache is not None:
+					hits, misses = self.cache.lookup(chunk)
+					for result in hits.iteritems():
+						yield result
+					chunk = [filename for filename in chunk
+							 if filename not in hits]
+					if not chunk:
+						continue
+				
+				# The pool is only started when there is something to parse
+				if pool is None and mode == 'process':
+					started = multiprocessing.queues.SimpleQueue()
+					pool = multiprocessing.Pool(workers, _init_worker,
+												(self.max_element_size,
+												 self.byte_budget,
+												 self.stats, started))
+					parse_chunk = _parse_worker
+				elif pool is None:
+					pool = multiprocessing.pool.ThreadPool(workers)
+					parse_chunk = self._parse_chunk_uncached
+				
+				# The callback is only called on success, failed chunks are
+				# found by _wait_chunk
+				async_result = pool.apply_async(
+					parse_chunk, (index, chunk),
+					callback=lambda results, index=index: done.put(index))
+				pending[index] = _Chunk(async_result, chunk, misses)
+				
+				while len(pending) >= workers * 2:
+					for result in self._wait_chunk(pending, done,
+												   started):
+						yield result
+			
+			while pending:
+				for result in self._wait_chunk(pending, done, started):
+					yield result
+		finally:
+			if pool is not None:
+				pool.terminate()
+				pool.join()
+	
+	def _wait_chunk(self, pending, done, started):
+		""" Wait for one of the pending chunks to finish, remove it and
+			return its results. When a chunk failed, because its results
+			couldn't be pickled or its worker process died, a ParseError is
+			returned for each of its files. """
+		while True:
+			try:
+				index = done.get(True, chunk_poll_interval)
+			except Queue.Empty:
+				index = _find_failed_chunk(pending, started)
+				if index is None:
+					continue
+			
+			chunk = pending.pop(index)
+			if chunk.result.ready():
+				try:
+					return self._store_results(chunk.result.get(0),
+											   chunk.misses)
+				except Exception, err:
+					error = ParseError("%s: %s" % (err.__class__.__name__,
+												   err))
+			else:
+				error = ParseError("The worker process parsing the file died")
+			
+			log.error("A chunk of %d files failed: %s", len(chunk.files),
+					  error)
+			return [(filename, error) for filename in chunk.files]
+	
+	def _store_results(self, results, misses):
+		""" Store the results of a chunk in the cache and return them. """
+		if self.cache is not None:
+			for filename, video in results:
+				if not isinstance(video, ParseError) and \
+				   misses.get(filename) is not None:
+					self.cache.store(misses[filename], video)
+		return results
+	
+	def _parse_one(self, filename, parse_file=None):
+		""" Parse one file for parse_files, an exception is returned as a
+			ParseError instead of raised. """
+		if parse_file is None:
+			parse_file = self.parse_file
+		try:
+			return filename, parse_file(filename)
+		except Exception, err:
+			error = ParseError("%s: %s" % (err.__class__.__name__, err))
+			error.stats = getattr(err, 'stats', None)
+			if error.stats is not None:
+				log.debug("Statistics of the failed parse of '%s': %r",
+						  filename, error.stats.to_dict())
+			return filename, error
+	
+	def _parse_chunk_uncached(self, index, filenames):
+		return [self._parse_one(filename, self._parse_file)
+				for filename in filenames]
+	
+	def _find_plugins(self, filename, header):
+		""" Return the plugins with a signature matching the header of the
+			file, a plugin for the file extension first. """
+		filetype = os.path.splitext(filename)[1][1:].lower()
+		
+		matches = [plugin for plugin in self.plugins
+				   if plugin.match_signature(header)]
+		matches.sort(key=lambda plugin: filetype not in plugin.file_types)
+		return matches
+	
+	def _parse_file_with(self, filename, stream, parser, video, fields=None):
+		
+		# The warnings are logged with the name of the file once the parser
+		# is done, the parser doesn't know it
+		known_warnings = len(video.warnings)
+		
 		# Check if this is the right parser for the file
 		try:
 			#print "Trying to parse %s with %s" % (filename, parser)
-			if parser.parse(filename, video):
+			if parser.parse(stream, video, fields):
 				return True
-			print "Failed..."
+			log.debug("%s doesn't recognise '%s'", parser.__module__, filename)
 		except AssertionError:
 			raise
 			return False
-		except IOError:
-			print "IOError on file '%s'"  % filename
+		except IOError, err:
+			parser.warn(video, "IOError: %s" % err)
 			return False
 		except:
-			print "Error parsing '%s'" % filename
+			log.debug("Error parsing '%s'", filename, exc_info=True)
 			raise
+		finally:
+			if len(video.warnings) > known_warnings:
+				_log_warnings(filename, video.warnings[known_warnings:])
+
+
+# The thread pool of parse_file_async, created on first use
+_async_pool = None
+_async_pool_lock = threading.Lock()
+
+def _get_async_pool():
+	global _async_pool
+	if _async_pool is None:
+		_async_pool_lock.acquire()
+		try:
+			if _async_pool is None:
+				import multiprocessing.pool
+				_async_pool = multiprocessing.pool.ThreadPool(async_workers)
+		finally:
+			_async_pool_lock.release()
+	return _async_pool
+
+# The VideoParser of a parse_files worker process
+_worker_parser = None
+
+# Queue on which a parse_files worker process reports the chunks it starts
+_worker_started = None
+
+def _init_worker(max_element_size, byte_budget, stats, started):
+	global _worker_parser, _worker_started
+	_worker_parser = VideoParser(max_element_size=max_element_size,
+								 byte_budget=byte_budget, stats=stats)
+	_worker_started = started
+
+def _parse_worker(index, filenames):
+	_worker_started.put((index, os.getpid()))
+	return [_worker_parser._parse_one(filename) for filename in filenames]
+
+class _Chunk(object):
+	""" A chunk of files handed to the pool by parse_files. """
+	__slots__ = ['result', 'files', 'misses', 'pid', 'dead']
+	
+	def __init__(self, result, files, misses):
+		self.result = result
+		self.files = files
+		self.misses = misses
+		self.pid = None
+		self.dead = False
+
+def _process_exists(pid):
+	""" Check if the process pid exists, the pool reaps the workers which
+		died. Without os.kill, on Windows, a process is assumed to exist. """
+	if os.name != 'posix':
+		return True
+	try:
+		os.kill(pid, 0)
+	except OSError, err:
+		return err.errno != errno.ESRCH
+	return True
+
+def _find_failed_chunk(pending, started):
+	""" Return the index of a pending chunk which failed, or None. A chunk
+		failed when its result is an exception, or when the worker process
+		which started it is gone and no result came for a poll interval. """
+	for index, chunk in pending.iteritems():
+		if chunk.result.ready() and not chunk.result.successful():
+			return index
+	
+	if started is None:
+		return None
+	
+	while not started.empty():
+		index, pid = started.get()
+		if index in pending:
+			pending[index].pid = pid
+	
+	# A chunk started by a worker which is gone will never finish
+	for index, chunk in pending.iteritems():
+		if chunk.pid is None or chunk.result.ready() or \
+		   _process_exists(chunk.pid):
+			continue
+		# The result of the worker may still be on its way
+		if chunk.dead:
+			return index
+		chunk.dead = True
+	return None
+
+# Names of the fields of the streams, the keys of their to_dict()
+_stream_fields = frozenset([
+	'bitrate', 'bits_per_sample', 'channels', 'clap', 'clean_aperture',
+	'codec', 'codec_description', 'codec_name', 'color_space', 'dropFrame',
+	'duration', 'enc_aperture', 'field_order', 'field_type', 'framerate',
+	'gamma', 'height', 'pasp', 'prod_aperture', 'sample_rate', 'sourceTC',
+	'trackID', 'track_assignment', 'type', 'width',
+])
+
+def _log_warnings(filename, warnings):
+	""" Log the warnings found in a file by a parser. """
+	for warning in warnings:
+		logger = logging.getLogger('videoparser.plugins.' + warning['source'])
+		if not logger.isEnabledFor(logging.WARNING):
+			continue
+		if warning['count'] > 1:
+			logger.warning("'%s': %s (%d times)", filename, warning['message'],
+						   warning['count'])
+		else:
+			logger.warning("'%s': %s", filename, warning['message'])
+
+def _check_fields(fields):
+	""" Return the requested fields as a frozenset, raises a ValueError for
+		fields the streams don't have. """
+	if fields is None:
+		return None
+	
+	fields = frozenset(fields)
+	unknown = fields - _stream_fields
+	if unknown:
+		raise ValueError("Unknown fields: %s" % ", ".join(sorted(unknown)))
+	return fields
+
+def _is_seekable(fileobj):
+	""" Check if the file object can seek, pipes and sockets can't. """
+	if hasattr(fileobj, 'seekable'):
+		return fileobj.seekable()
+	try:
+		fileobj.seek(fileobj.tell())
+	except (AttributeError, IOError, OSError):
+		return False
+	return True
 
-if __name__ == "__main__":
-	video_parser = VideoParser()
-	for filename in sys.argv[1:]:
-		print repr(video_parser.parse_file(filename))
+def _split(iterable, size):
+	""" Yield lists of size items from the iterable, the last one may be
+		shorter. """
+	iterator = iter(iterable)
+	while True:
+		chunk = list(itertools.islice(iterator, size))
+		if not chunk:
+			return
+		yield chunk
@@ -0,0 +1,293 @@
+"""Command line scanner, writes the information of video files as JSON Lines
+
+	python -m videoparser [options] PATH...
+"""
+#
+#  Copyright (c) 2007 Michael van Tellingen <michaelvantellingen@gmail.com>
+#  All rights reserved.
+#
+#  Redistribution and use in source and binary forms, with or without
+#  modification, are permitted provided that the following conditions
+#  are met:
+#  1. Redistributions of source code must retain the above copyright
+#     notice, this list of conditions and the following disclaimer.
+#  2. The name of the author may not be used to endorse or promote products
+#     derived from this software without specific prior written permission
+#
+#  THIS SOFTWARE IS PROVIDED BY THE AUTHOR ``AS IS'' AND ANY EXPRESS OR
+#  IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED WARRANTIES
+#  OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE DISCLAIMED.
+#  IN NO EVENT SHALL THE AUTHOR BE LIABLE FOR ANY DIRECT, INDIRECT,
+#  INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT
+#  NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE,
+#  DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY
+#  THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+#  (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF
+#  THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+#
+
+# Python built-in modules
+import fnmatch
+import json
+import logging
+import optparse
+import os
+import sys
+import time
+
+# Project modules
+import videoparser
+
+# Seconds between two progress lines on stderr
+progress_interval = 1.0
+
+
+def find_files(paths, includes, excludes):
+	""" Yield the files in paths, directories are walked recursively. A file
+		is yielded when its name matches one of the include patterns, or
+		there are none, and neither its name nor its path matches one of the
+		exclude patterns. Excluded directories are not walked."""
+	def excluded(path):
+		name = os.path.basename(path)
+		for pattern in excludes:
+			if fnmatch.fnmatch(name, pattern) or fnmatch.fnmatch(path, pattern):
+				return True
+		return False
+
+	def included(path):
+		if excluded(path):
+			return False
+		if not includes:
+			return True
+		name = os.path.basename(path)
+		for pattern in includes:
+			if fnmatch.fnmatch(name, pattern):
+				return True
+		return False
+
+	for path in paths:
+		if not os.path.isdir(path):
+			if included(path):
+				yield path
+			continue
+
+		for dirpath, dirnames, filenames in os.walk(path):
+			dirnames[:] = sorted(dirname for dirname in dirnames
+								 if not excluded(os.path.join(dirpath,
+															  dirname)))
+			for filename in sorted(filenames):
+				filename = os.path.join(dirpath, filename)
+				if included(filename):
+					yield filename
+
+
+def to_record(filename, result):
+	""" Return the JSON object written for a file. """
+	record = {'path': filename}
+	if isinstance(result, videoparser.ParseError):
+		record['status'] = 'error'
+		record['error'] = str(result)
+	elif result is None:
+		record['status'] = 'unrecognized'
+	else:
+		record['status'] = 'ok'
+		record.update(result.to_dict())
+	return _decode(record)
+
+
+def to_json(filename, result):
+	""" Return the JSON line written for a file. A result which can't be
+		serialised is written as an error of the file, so it doesn't stop
+		the scan. """
+	try:
+		record = to_record(filename, result)
+		line = json.dumps(record, default=repr)
+	except Exception, err:
+		record = to_record(filename, videoparser.ParseError(
+			"Can't serialise the result: %s: %s" % (err.__class__.__name__,
+													 err)))
+		line = json.dumps(record, default=repr)
+	return record['status'], line + "\n"
+
+
+def _decode(value):
+	""" Return value with the byte strings in it as unicode. Names and
+		codecs come from the files, bytes which aren't UTF-8 are decoded as
+		latin-1 so they are kept. """
+	if isinstance(value, str):
+		try:
+			return value.decode('utf-8')
+		except UnicodeDecodeError:
+			return value.decode('latin-1')
+	if isinstance(value, dict):
+		return dict((_decode(key), _decode(item))
+					for key, item in value.iteritems())
+	if isinstance(value, (list, tuple)):
+		return [_decode(item) for item in value]
+	return value
+
+
+class Progress(object):
+	""" Counts the results and reports the progress on stderr. """
+
+	def __init__(self, output, enabled=True):
+		self.output = output
+		self.enabled = enabled
+		self.counts = {'ok': 0, 'unrecognized': 0, 'error': 0}
+		self.total = 0
+		self.start = time.time()
+		self._last = self.start
+
+	def add(self, status):
+		self.counts[status] += 1
+		self.total += 1
+
+		now = time.time()
+		if self.enabled and now - self._last >= progress_interval:
+			self._last = now
+			self.output.write("\r%d files, %d errors, %.1f files/s " % (
+				self.total, self.counts['error'], self.rate(now)))
+			self.output.flush()
+
+	def rate(self, now=None):
+		elapsed = (now or time.time()) - self.start
+		if elapsed <= 0:
+			return 0.0
+		return self.total / elapsed
+
+	def summary(self):
+		elapsed = time.time() - self.start
+		if self.enabled:
+			self.output.write("\r")
+		self.output.write("%d files in %.1fs (%.1f files/s): %d parsed, "
+						  "%d unrecognized, %d errors\n" % (
+			self.total, elapsed, self.rate(), self.counts['ok'],
+			self.counts['unrecognized'], self.counts['error']))
+
+
+def main(argv=None):
+	usage = "python -m videoparser [options] PATH..."
+	option_parser = optparse.OptionParser(usage=usage,
+										  version=videoparser.__version__)
+	option_parser.add_option("-i", "--include", action="append",
+							 default=[], metavar="GLOB",
+							 help="only scan files with a matching name, may "
+								  "be given more than once")
+	option_parser.add_option("-x", "--exclude", action="append",
+							 default=[], metavar="GLOB",
+							 help="skip files and directories with a "
+								  "matching name or path, may be given more "
+								  "than once")
+	option_parser.add_option("-j", "--workers", type="int", default=None,
+							 help="number of workers, defaults to the "
+								  "number of CPUs")
+	option_parser.add_option("-m", "--mode", choices=['process', 'thread'],
+							 default='process',
+							 help="run the workers as 'process' (default) or "
+								  "'thread'")
+	option_parser.add_option("-c", "--cache", metavar="FILE",
+							 help="keep the results in a cache database")
+	option_parser.add_option("-d", "--dedup", action="store_true",
+							 default=False,
+							 help="parse byte identical copies of a file "
+								  "once and report the work saved on "
+								  "stderr, the workers run as threads")
+	option_parser.add_option("--max-element-size", type="int", default=None,
+							 metavar="BYTES",
+							 help="fail files with an element larger than "
+								  "BYTES")
+	option_parser.add_option("--byte-budget", type="int", default=None,
+							 metavar="BYTES",
+							 help="fail files which need more than BYTES read "
+								  "to parse")
+	option_parser.add_option("-o", "--output", metavar="FILE",
+							 help="write to FILE instead of stdout")
+	option_parser.add_option("-q", "--quiet", action="store_true",
+							 default=False,
+							 help="don't report the progress on stderr")
+	option_parser.add_option("-s", "--stats", action="store_true",
+							 default=False,
+							 help="add the I/O and time spent to each file "
+								  "and report the totals on stderr")
+	option_parser.add_option("--trace", metavar="FILE",
+							 help="write a Chrome trace of the elements "
+								  "parsed in every file to FILE, the workers "
+								  "run as threads")
+	option_parser.add_option("-v", "--verbose", action="count", default=0,
+							 help="log the warnings found in the files on "
+								  "stderr, twice to log debug messages too")
+	options, paths = option_parser.parse_args(argv)
+	if not paths:
+		option_parser.error("no paths given")
+
+	cache = None
+	if options.cache:
+		from videoparser.cache import ParseCache
+		cache = ParseCache(options.cache)
+
+	# The warnings are in the output, they are only logged when asked for
+	logging.basicConfig(format="%(levelname)s %(name)s: %(message)s",
+						level=[logging.ERROR, logging.WARNING,
+							   logging.DEBUG][min(options.verbose, 2)])
+
+	# The dedup cache and the tracer can't be shared with worker processes
+	dedup = None
+	if options.dedup:
+		from videoparser.cache import DedupCache
+		dedup = DedupCache()
+		options.mode = 'thread'
+
+	tracer = None
+	if options.trace:
+		from videoparser.tracing import Tracer
+		tracer = Tracer()
+		options.mode = 'thread'
+
+	output = sys.stdout
+	if options.output:
+		output = open(options.output, 'w')
+
+	parser = videoparser.VideoParser(cache=cache, dedup=dedup,
+									 max_element_size=options.max_element_size,
+									 byte_budget=options.byte_budget,
+									 stats=options.stats,
+									 tracer=tracer)
+	progress = Progress(sys.stderr, enabled=not options.quiet)
+	summary = videoparser.stats.Summary()
+	filenames = find_files(paths, options.include, options.exclude)
+
+	try:
+		for filename, result in parser.parse_files(filenames,
+												   options.workers,
+												   options.mode):
+			status, line = to_json(filename, result)
+			output.write(line)
+			output.flush()
+			progress.add(status)
+			if options.stats:
+				summary.add(result)
+	finally:
+		if output is not sys.stdout:
+			output.close()
+		if cache is not None:
+			cache.close()
+		if tracer is not None:
+			trace_file = open(options.trace, 'w')
+			try:
+				tracer.write_chrome(trace_file)
+			finally:
+				trace_file.close()
+
+	if not options.quiet:
+		progress.summary()
+	if options.stats:
+		sys.stderr.write(summary.report() + "\n")
+	if dedup is not None:
+		sys.stderr.write("%d copies not parsed again, %.1fs saved, %d bytes "
+						 "hashed\n" % (dedup.hits, dedup.saved_seconds,
+										dedup.bytes_hashed))
+	return 0
+
+
+if __name__ == "__main__":
+	sys.exit(main())
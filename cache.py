@@ -0,0 +1,471 @@
+"""Caches of parse results, so unchanged files are not parsed again"""
+#
+#  Copyright (c) 2007 Michael van Tellingen <michaelvantellingen@gmail.com>
+#  All rights reserved.
+#
+#  Redistribution and use in source and binary forms, with or without
+#  modification, are permitted provided that the following conditions
+#  are met:
+#  1. Redistributions of source code must retain the above copyright
+#     notice, this list of conditions and the following disclaimer.
+#  2. The name of the author may not be used to endorse or promote products
+#     derived from this software without specific prior written permission
+#
+#  THIS SOFTWARE IS PROVIDED BY THE AUTHOR ``AS IS'' AND ANY EXPRESS OR
+#  IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED WARRANTIES
+#  OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE DISCLAIMED.
+#  IN NO EVENT SHALL THE AUTHOR BE LIABLE FOR ANY DIRECT, INDIRECT,
+#  INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT
+#  NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE,
+#  DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY
+#  THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+#  (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF
+#  THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+#
+
+# Python built-in modules
+import collections
+import cPickle
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+
+from videoparser.version import version
+
+
+__all__ = ['ParseCache', 'MemoryCache', 'DedupCache', 'file_key']
+
+# Number of stored results after which they are committed to the database
+commit_interval = 256
+
+# Number of parameters in one sqlite query, sqlite allows at most 999
+_query_size = 500
+
+# Number of bytes of a fingerprint region which are read at once
+_hash_chunk = 65536
+
+
+def _dumps(video):
+	""" Pickle a VideoFile for a cache. The stats of the parse are left out,
+		a hit isn't parsed again. """
+	stats = video.stats
+	if stats is None:
+		return cPickle.dumps(video, cPickle.HIGHEST_PROTOCOL)
+	
+	video.set_stats(None)
+	try:
+		return cPickle.dumps(video, cPickle.HIGHEST_PROTOCOL)
+	finally:
+		video.set_stats(stats)
+
+
+def file_key(filename):
+	""" Return the (key, size, mtime_ns) of the file, the key identifies the
+		file by device and inode. Raises OSError when the file can't be
+		stat'ed."""
+	st = os.stat(filename)
+	mtime_ns = getattr(st, 'st_mtime_ns', None)
+	if mtime_ns is None:
+		mtime_ns = int(round(st.st_mtime * 1000000000))
+	return ("%d:%d" % (st.st_dev, st.st_ino), st.st_size, mtime_ns)
+
+
+class ParseCache(object):
+	""" Cache of VideoFile objects in a sqlite3 database. The entries are
+		keyed by the device and inode of the file and are only valid as long
+		as the size and modification time of the file stay the same. All
+		entries are dropped when the database was written by another version
+		of videoparser. When there are more than max_entries entries the
+		least recently used ones are removed.
+
+		Only successfully parsed files are stored, errors and files which
+		were not recognized are parsed again next time.
+
+		Example:
+			cache = ParseCache("/var/cache/videoparser.db")
+			parser = VideoParser(cache=cache)
+			for filename, video in parser.parse_files(filenames):
+				...
+			cache.close()"""
+
+	def __init__(self, filename, max_entries=1000000):
+		self.max_entries = max_entries
+
+		# The connection is shared by all threads, access is serialised by
+		# the lock
+		self._lock = threading.Lock()
+		self._db = sqlite3.connect(filename, check_same_thread=False)
+		self._db.text_factory = str
+		self._pending = 0
+
+		self._db.execute("CREATE TABLE IF NOT EXISTS meta ("
+						 "name TEXT PRIMARY KEY, value TEXT)")
+		self._db.execute("CREATE TABLE IF NOT EXISTS results ("
+						 "key TEXT PRIMARY KEY, size INTEGER, "
+						 "mtime_ns INTEGER, accessed INTEGER, data BLOB)")
+		self._db.execute("CREATE INDEX IF NOT EXISTS results_accessed "
+						 "ON results (accessed)")
+
+		row = self._db.execute("SELECT value FROM meta "
+							   "WHERE name = 'version'").fetchone()
+		if row is None or row[0] != version:
+			self._db.execute("DELETE FROM results")
+			self._db.execute("INSERT OR REPLACE INTO meta VALUES "
+							 "('version', ?)", (version,))
+		self._db.commit()
+
+		# Entries are stamped with a counter on use to find the least
+		# recently used ones
+		self._clock, self._count = self._db.execute(
+			"SELECT COALESCE(MAX(accessed), 0), COUNT(*) "
+			"FROM results").fetchone()
+
+	def __len__(self):
+		return self._count
+
+	def lookup(self, filenames):
+		""" Look up the files and return a (hits, misses) tuple. hits maps the
+			filenames found in the cache to their VideoFile, misses maps the
+			others to their file_key for a later store, or None when the file
+			can't be stat'ed. Outdated entries are removed."""
+		hits = {}
+		misses = {}
+		keys = {}
+		for filename in filenames:
+			try:
+				keys[filename] = file_key(filename)
+			except OSError:
+				misses[filename] = None
+
+		self._lock.acquire()
+		try:
+			rows = {}
+			names = list(set(stat_key[0] for stat_key in keys.itervalues()))
+			for i in range(0, len(names), _query_size):
+				chunk = names[i:i + _query_size]
+				rows.update((row[0], row[1:]) for row in self._db.execute(
+					"SELECT key, size, mtime_ns, data FROM results WHERE key "
+					"IN (%s)" % ",".join("?" * len(chunk)), chunk))
+
+			used = []
+			outdated = []
+			for filename, stat_key in keys.iteritems():
+				key, size, mtime_ns = stat_key
+				row = rows.get(key)
+				if row is not None and row[:2] == (size, mtime_ns):
+					hits[filename] = cPickle.loads(str(row[2]))
+					used.append(key)
+					continue
+
+				if row is not None:
+					outdated.append(key)
+				misses[filename] = stat_key
+
+			if used:
+				self._clock += 1
+				self._db.executemany("UPDATE results SET accessed = ? "
+									 "WHERE key = ?",
+									 [(self._clock, key) for key in used])
+			if outdated:
+				self._db.executemany("DELETE FROM results WHERE key = ?",
+									 [(key,) for key in outdated])
+				self._count -= len(outdated)
+			if used or outdated:
+				self._pending += 1
+				self._maybe_commit()
+		finally:
+			self._lock.release()
+
+		return hits, misses
+
+	def store(self, stat_key, video):
+		""" Store the VideoFile of the file with the file_key returned by
+			lookup, which was taken before the file was parsed. A video of
+			None is not stored. """
+		if video is None:
+			return
+		key, size, mtime_ns = stat_key
+		data = _dumps(video)
+
+		self._lock.acquire()
+		try:
+			self._clock += 1
+			cursor = self._db.execute("DELETE FROM results WHERE key = ?",
+									  (key,))
+			self._count -= cursor.rowcount
+			self._db.execute("INSERT INTO results VALUES (?, ?, ?, ?, ?)",
+							 (key, size, mtime_ns, self._clock,
+							  sqlite3.Binary(data)))
+			self._count += 1
+
+			if self._count > self.max_entries:
+				self._evict()
+
+			self._pending += 1
+			self._maybe_commit()
+		finally:
+			self._lock.release()
+
+	def invalidate(self, filename):
+		""" Remove the entry of the file from the cache. """
+		key = file_key(filename)[0]
+		self._lock.acquire()
+		try:
+			cursor = self._db.execute("DELETE FROM results WHERE key = ?",
+									  (key,))
+			self._count -= cursor.rowcount
+			self._pending += 1
+			self._maybe_commit()
+		finally:
+			self._lock.release()
+
+	def clear(self):
+		""" Remove all entries from the cache. """
+		self._lock.acquire()
+		try:
+			self._db.execute("DELETE FROM results")
+			self._db.commit()
+			self._count = 0
+			self._pending = 0
+		finally:
+			self._lock.release()
+
+	def flush(self):
+		""" Commit the stored results to the database. """
+		self._lock.acquire()
+		try:
+			self._db.commit()
+			self._pending = 0
+		finally:
+			self._lock.release()
+
+	def close(self):
+		self.flush()
+		self._db.close()
+
+	def _evict(self):
+		""" Remove the least recently used entries, with some slack so this
+			isn't needed on every store. """
+		excess = self._count - self.max_entries + self.max_entries // 10
+		cursor = self._db.execute(
+			"DELETE FROM results WHERE key IN (SELECT key FROM results "
+			"ORDER BY accessed LIMIT ?)", (excess,))
+		self._count -= cursor.rowcount
+
+	def _maybe_commit(self):
+		if self._pending >= commit_interval:
+			self._db.commit()
+			self._pending = 0
+
+
+class MemoryCache(object):
+	""" In process LRU cache of parse results, with the same interface as
+		ParseCache. Files for which no parser matched are cached as well, so
+		a file which isn't a video is only sniffed once.
+
+		Entries expire after ttl seconds and the least recently used ones are
+		evicted when there are more than max_entries. The hits, misses,
+		evictions and expirations counters help to size the cache. Results
+		are kept pickled, every hit returns a new VideoFile object.
+
+		Example:
+			cache = MemoryCache(max_entries=10000, ttl=600)
+			parser = VideoParser(cache=cache)
+			...
+			print cache.hits, cache.misses, cache.evictions"""
+
+	def __init__(self, max_entries=10000, ttl=300):
+		self.max_entries = max_entries
+		self.ttl = ttl
+
+		self.hits = 0
+		self.misses = 0
+		self.evictions = 0
+		self.expirations = 0
+
+		# Maps the key to a (size, mtime_ns, expires, data) tuple, the least
+		# recently used entry first
+		self._entries = collections.OrderedDict()
+		self._lock = threading.Lock()
+
+	def __len__(self):
+		return len(self._entries)
+
+	def lookup(self, filenames):
+		""" Look up the files, see ParseCache.lookup. A hit is either a
+			VideoFile or None when no parser matched the file. """
+		hits = {}
+		misses = {}
+		now = time.time()
+
+		self._lock.acquire()
+		try:
+			for filename in filenames:
+				try:
+					stat_key = file_key(filename)
+				except OSError:
+					misses[filename] = None
+					self.misses += 1
+					continue
+
+				key, size, mtime_ns = stat_key
+				entry = self._entries.pop(key, None)
+				if entry is not None and entry[:2] == (size, mtime_ns):
+					if entry[2] > now:
+						self._entries[key] = entry
+						data = entry[3]
+						if data is not None:
+							data = cPickle.loads(data)
+						hits[filename] = data
+						self.hits += 1
+						continue
+					self.expirations += 1
+
+				misses[filename] = stat_key
+				self.misses += 1
+		finally:
+			self._lock.release()
+
+		return hits, misses
+
+	def store(self, stat_key, video):
+		""" Store the result of the file with the file_key returned by
+			lookup. """
+		key, size, mtime_ns = stat_key
+		data = None
+		if video is not None:
+			data = _dumps(video)
+
+		self._lock.acquire()
+		try:
+			self._entries.pop(key, None)
+			self._entries[key] = (size, mtime_ns, time.time() + self.ttl, data)
+			while len(self._entries) > self.max_entries:
+				self._entries.popitem(last=False)
+				self.evictions += 1
+		finally:
+			self._lock.release()
+
+	def invalidate(self, filename):
+		""" Remove the entry of the file from the cache. """
+		key = file_key(filename)[0]
+		self._lock.acquire()
+		try:
+			self._entries.pop(key, None)
+		finally:
+			self._lock.release()
+
+	def clear(self):
+		""" Remove all entries from the cache. """
+		self._lock.acquire()
+		try:
+			self._entries.clear()
+		finally:
+			self._lock.release()
+
+	def flush(self):
+		pass
+
+	def close(self):
+		self.clear()
+
+
+class DedupCache(object):
+	""" Cache of parse results keyed by a fingerprint of the file contents,
+		so byte identical copies of a file under another name are parsed
+		only once. The fingerprint is a hash of the size of the file and of
+		the regions which the matching parser reads, see
+		plugins.BaseParser.fingerprint_regions, so a copy costs reading
+		the header instead of a full parse.
+
+		The counters report the saved work: hits is the number of parses
+		which were skipped, saved_seconds the time these parses took the
+		first time and bytes_hashed the cost of fingerprinting.
+
+		Example:
+			dedup = DedupCache()
+			parser = VideoParser(dedup=dedup)
+			for filename, video in parser.parse_files(filenames,
+													  mode='thread'):
+				...
+			print "%d parses saved, %.1fs" % (dedup.hits,
+											  dedup.saved_seconds)"""
+
+	def __init__(self, max_entries=10000):
+		self.max_entries = max_entries
+
+		self.hits = 0
+		self.misses = 0
+		self.saved_seconds = 0.0
+		self.bytes_hashed = 0
+
+		# Maps the fingerprint to a (data, seconds) tuple, the least recently
+		# used entry first
+		self._entries = collections.OrderedDict()
+		self._lock = threading.Lock()
+
+	def __len__(self):
+		return len(self._entries)
+
+	def fingerprint(self, stream, name, regions):
+		""" Return the fingerprint of the regions of the stream, name is the
+			name of the plugin which reads them. """
+		digest = hashlib.sha1("%s:%d" % (name, stream.get_size()))
+		count = 0
+		for offset, length in regions:
+			stream.seek(offset)
+			digest.update("%d:" % offset)
+			end = count + length
+			while count < end:
+				data = stream.read(min(end - count, _hash_chunk))
+				if not data:
+					break
+				digest.update(data)
+				count += len(data)
+			digest.update(":%d:" % (length - (end - count)))
+
+		self._lock.acquire()
+		try:
+			self.bytes_hashed += count
+		finally:
+			self._lock.release()
+		return digest.digest()
+
+	def get(self, fingerprint):
+		""" Return a new VideoFile for the fingerprint or None when there is
+			none. """
+		self._lock.acquire()
+		try:
+			entry = self._entries.pop(fingerprint, None)
+			if entry is None:
+				self.misses += 1
+				return None
+			self._entries[fingerprint] = entry
+			self.hits += 1
+			self.saved_seconds += entry[1]
+		finally:
+			self._lock.release()
+		return cPickle.loads(entry[0])
+
+	def put(self, fingerprint, video, seconds):
+		""" Store the VideoFile of the fingerprint, seconds is the time it
+			took to parse the file. """
+		data = _dumps(video)
+		self._lock.acquire()
+		try:
+			self._entries.pop(fingerprint, None)
+			self._entries[fingerprint] = (data, seconds)
+			while len(self._entries) > self.max_entries:
+				self._entries.popitem(last=False)
+		finally:
+			self._lock.release()
+
+	def clear(self):
+		""" Remove all entries from the cache. """
+		self._lock.acquire()
+		try:
+			self._entries.clear()
+		finally:
+			self._lock.release()
@@ -22,6 +22,137 @@
 #  THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
 #
 
+import threading
+
+import videoparser.streams as streams
+
+# Number of bytes from the start of the file used to fingerprint it, when the
+# parser doesn't know which regions it reads
+fingerprint_size = 65536
+
+
 class BaseParser(object):
-    pass
+    
+    # Byte order of the format, set on the stream before parsing
+    _endianess = streams.endian.little
+    
+    # Maps parts of the file, such as atoms or objects, to the fields of the
+    # streams which depend on them. When only some fields are requested the
+    # parts which don't contribute to them are skipped, parts which aren't
+    # listed are always parsed.
+    field_dependencies = {}
+    
+    def parse(self, stream, video, fields=None):
+        """ Parse the stream, which is positioned at the start of the file,
+            and fill video with the information found. fields is a set of
+            the requested stream fields, or None for all. Returns True on
+            success. """
+        raise NotImplementedError()
+    
+    def wanted(self, fields, part):
+        """ Check if a part of the file has to be parsed for the requested
+            fields. """
+        if fields is None:
+            return True
+        depends = self.field_dependencies.get(part)
+        return depends is None or not fields.isdisjoint(depends)
+    
+    def warn(self, video, message, **details):
+        """ Report a problem in the file, it's added to the warnings of video
+            which VideoParser logs when the parser is done. details are values
+            of basic types describing it, like the offset."""
+        video.add_warning(self.__module__.rsplit('.', 1)[-1], message,
+                          **details)
+    
+    def fingerprint_regions(self, stream):
+        """ Return the (offset, length) regions of the file which parse()
+            reads, used to recognise copies of a file which was parsed
+            before. The stream is positioned at the start of the file. """
+        return [(0, min(stream.get_size(), fingerprint_size))]
+    
+    def parse_file(self, filename, video):
+        """ Open filename and parse it with this parser. """
+        stream = streams.factory.create_filestream(filename, self._endianess)
+        try:
+            return self.parse(stream, video)
+        finally:
+            stream.close()
+
+
+class ParseContext(object):
+    """ State of a single parse call. A Parser is shared by all threads in
+        the process, so anything specific to the file being parsed is kept
+        on a ParseContext created by parse() instead of on the Parser.
+
+        Example:
+            context = plugins.ParseContext(last_stream_header=None)"""
+    
+    def __init__(self, **kwargs):
+        self.__dict__.update(kwargs)
+
+
+class Plugin(object):
+    """ Describes a parser plugin without importing it. The plugin module is
+        imported the first time its parser is needed, the Parser instance is
+        shared by everything in the process using the plugin. """
+    
+    _lock = threading.Lock()
+    
+    def __init__(self, name, file_types, signatures):
+        # Name of the module in videoparser.plugins
+        self.name = name
+        
+        # File extensions of the format, used to choose between plugins when
+        # the signatures of more than one plugin match
+        self.file_types = file_types
+        
+        # Signatures identifying the format, each signature is a sequence of
+        # (offset, magic bytes) pairs which all have to match
+        self.signatures = signatures
+        
+        self._parser = None
+    
+    def __repr__(self):
+        return "<Plugin %s>" % self.name
+    
+    def get_parser(self):
+        """ Return the Parser of the plugin, importing it when needed. """
+        if self._parser is None:
+            self._lock.acquire()
+            try:
+                if self._parser is None:
+                    module = __import__("videoparser.plugins." + self.name,
+                                        None, None, "plugins")
+                    self._parser = module.Parser()
+            finally:
+                self._lock.release()
+        return self._parser
+    
+    def match_signature(self, header):
+        """ Check if the first bytes of a file match one of the signatures of
+            this plugin."""
+        for signature in self.signatures:
+            for offset, magic in signature:
+                if header[offset:offset + len(magic)] != magic:
+                    break
+            else:
+                return True
+        return False
+
+
+# The registry of all available plugins, by name
+registry = {}
+
+def register(name, file_types, signatures):
+    registry[name] = Plugin(name, file_types, signatures)
+
 
+register('asf', ['wmv'],
+         [((0, streams.guid.to_bytes(
+                '75B22630-668E-11CF-A6D9-00AA0062CE6C')),)])
+register('matroska', ['mkv'], [((0, '\x1a\x45\xdf\xa3'),)])
+register('avi', ['avi'], [((0, 'RIFF'), (8, 'AVI '))])
+register('realmedia', ['rm'], [((0, '.RMF'),)])
+register('quicktime', ['mov', 'mp4'],
+         [((4, 'ftyp'),), ((4, 'moov'),), ((4, 'mdat'),), ((4, 'wide'),),
+          ((4, 'free'),), ((4, 'skip'),), ((4, 'pnot'),)])
@@ -60,35 +60,81 @@ guid_list = {
     '1806D474-CADF-4509-A4BA-9AABCB96AAE8': 'ASF_Padding_Object',
 }
 
-
+# The guid_list keyed by the raw GUIDs as they are stored in the file
+guid_names = dict((streams.guid.to_bytes(guid), name)
+                  for guid, name in guid_list.iteritems())
+
+
+# Fixed size part of the ASF_File_Properties_Object (after the file id)
+file_properties_layout = streams.Layout([
+    ('size',                'Q'),
+    ('create_date',         'Q', streams.layout.win_timestamp),
+    ('packet_count',        'Q'),
+    ('play_duration',       'Q', streams.layout.win_duration),
+    ('send_duration',       'Q', streams.layout.win_duration),
+    ('preroll',             'Q'),
+    ('flags',               'I'),
+    ('min_packet_size',     'I'),
+    ('max_packet_size',     'I'),
+    ('max_bitrate',         'I'),
+])
+
+# Fixed size part of the ASF_Extended_Stream_Properties_Object
+extended_stream_properties_layout = streams.Layout([
+    ('start_time',                  'Q'),
+    ('end_time',                    'Q'),
+    ('data_bitrate',                'I'),
+    ('buffer_size',                 'I'),
+    ('initial_buffer_fullness',     'I'),
+    ('alt_data_bitrate',            'I'),
+    ('alt_buffer_size',             'I'),
+    ('alt_initial_buffer_fullness', 'I'),
+    ('max_object_size',             'I'),
+    ('flags',                       'I'),
+    ('stream_number',               'H'),
+    ('stream_language_id',          'H'),
+    ('avg_time_per_frame',          'Q'),
+    ('stream_name_length',          'H'),
+    ('payload_extension_length',    'H'),
+])
 
 
 class Parser(plugins.BaseParser):
     _endianess = streams.endian.little
-    _file_types = ['wmv']
     
     def __init__(self):
         plugins.BaseParser.__init__(self)
         
-    def parse(self, filename, video):
+    # The codec list and bitrate properties aren't used for the results
+    field_dependencies = {
+        'ASF_File_Properties_Object':               ['duration'],
+        'ASF_Header_Extension_Object':              ['framerate'],
+        'ASF_Codec_List_Object':                    [],
+        'ASF_Stream_Bitrate_Properties_Object':     [],
+    }
+    
+    def parse(self, stream, video, fields=None):
+        stream.set_endianess(self._endianess)
         
-        stream = streams.factory.create_filestream(filename,
-                                                   endianess=self._endianess)
-            
-        object_id   = stream.read_guid()
+        object_id   = stream.read_guid_bytes()
         
-        if guid_list.get(object_id) != 'ASF_Header_Object':
+        if guid_names.get(object_id) != 'ASF_Header_Object':
             return False
 
         try:                    
-            header = self.parse_header(stream)
+            header = self.parse_header(stream, video, fields)
         except AssertionError:
             return False
     
         self.extract_information(header, video)
         return True
     
+    def fingerprint_regions(self, stream):
+        """ Only the header object is parsed. """
+        stream.seek(16)
+        return [(0, min(stream.get_size(), stream.read_uint64()))]
     
+
     def extract_information(self, header, video):
 
         #print header
@@ -144,11 +190,16 @@ class Parser(plugins.BaseParser):
         return video
     
     
-    def parse_header(self, stream):
+    def parse_header(self, stream, video, fields=None):
         
         # Read the header information
         header = self.Header()
         header.size = stream.read_uint64()
+
+        # Read the complete header object at once, the objects in it are
+        # parsed from views on this buffer
+        stream = stream.read_subsegment(header.size - 24)
+
         header.num_objects = stream.read_uint32()
         header.reserved_1  = stream.read_uint8()
         header.reserved_2  = stream.read_uint8()
@@ -158,23 +209,41 @@ class Parser(plugins.BaseParser):
         if header.reserved_2 != 0x02:
             raise AssertionError('Reserved2 in Header Object should be 0x02')
         
+        # The span of an object ends when the next object is read
+        tracer = stream.tracer
+        span = None
+        
         # Loop through all objects contained in the header
         for i in range(0, header.num_objects):
-            guid = stream.read_guid()
+            if span is not None:
+                tracer.end(span)
+                span = None
+            
+            guid = stream.read_guid_bytes()
             size = stream.read_uint64()
             
             obj = None
             
             try:
-                object_type = guid_list[guid]
+                object_type = guid_names[guid]
             except:
                 # Unrecognized object, skip over it
-                raise AssertionError("Unregognized object: %s" % guid)
+                raise AssertionError("Unregognized object: %s" %
+                                     streams.guid.to_string(guid))
                 stream.skip(size - 24)
                 continue
             
+            wanted = self.wanted(fields, object_type)
+            if tracer is not None:
+                span = tracer.begin(object_type, 'asf',
+                                    stream.file_offset() - 24, size,
+                                    None if wanted else 'skip')
+            
             data = stream.read_subsegment(size - 24)
 
+            if not wanted:
+                continue
+
             if object_type == 'ASF_Content_Description_Object':
                 obj = 'ASF_Content_Description_Object (TODO)'
             
@@ -197,46 +266,37 @@ class Parser(plugins.BaseParser):
                 obj = self.parse_stream_bitrate_properties(data)
             
             else:
-                print "Warning: unhandled object: %s" % object_type
+                self.warn(video, "Unhandled object: %s" % object_type)
                 
             header.objects.append(obj)
 
             data.close()
             #print guid_list[guid], size
 
+        if span is not None:
+            tracer.end(span)
         return header
         
     # mandatory, one only
     def parse_file_properties(self, data):
         fileprop = self.FileProperties()
-        fileprop.id = data.read_guid()
-        fileprop.size = data.read_uint64()
-        fileprop.create_date = data.read_timestamp_win()
-        fileprop.packet_count = data.read_uint64()
-        fileprop.play_duration = datetime.timedelta(
-                                    microseconds=data.read_uint64()/10)
-        fileprop.send_duration = datetime.timedelta(
-                                    microseconds=data.read_uint64()/10)
-        fileprop.preroll = data.read_uint64()
+        fileprop.id = data.read_guid_bytes()
+        data.read_record(file_properties_layout, fileprop)
 
         # Flags
-        flags = data.read_uint32()
+        flags = fileprop.flags
         fileprop.broadcast_flag = flags & 0x01
         fileprop.seekable_flag = (flags >> 1) & 0x01
         fileprop.reserved = flags >> 2
         
-        fileprop.min_packet_size = data.read_uint32()
-        fileprop.max_packet_size = data.read_uint32()
-        fileprop.max_bitrate = data.read_uint32()
-        
         return fileprop
     
     # mandatory, one only
     def parse_stream_properties(self, data):
         stream = self.StreamProperties()
         
-        stream.type = guid_list[data.read_guid()]
-        stream.ecc_type    = guid_list[data.read_guid()]
+        stream.type = guid_names[data.read_guid_bytes()]
+        stream.ecc_type    = guid_names[data.read_guid_bytes()]
         stream.time_offset = data.read_uint64()
         stream.type_length = data.read_uint32()
         stream.ecc_length  = data.read_uint32()
@@ -270,7 +330,7 @@ class Parser(plugins.BaseParser):
     # mandatory, one only
     def parse_header_extension(self, data):
         header = self.HeaderExtension()
-        header.reserved_1 = data.read_guid()   # should be ASF_Reserved_1
+        header.reserved_1 = data.read_guid_bytes() # should be ASF_Reserved_1
         header.reserved_2 = data.read_uint16() # should be 6
         header.size       = data.read_uint32()
         header.extension_data = []
@@ -278,7 +338,7 @@ class Parser(plugins.BaseParser):
         # Check reserved_1
         bytes = header.size
         while bytes > 0:
-            object_id = data.read_guid()
+            object_id = data.read_guid_bytes()
             object_size = data.read_uint64()
             bytes -= object_size
             
@@ -288,7 +348,7 @@ class Parser(plugins.BaseParser):
             sub_data = data.read_subsegment(object_size - 24)
             
             try:
-                object_type = guid_list[object_id]
+                object_type = guid_names[object_id]
             except KeyError:
                 # Skip unknown guid's, since authors are allowed to create
                 # there own
@@ -345,29 +405,16 @@ class Parser(plugins.BaseParser):
     
     def parse_extended_stream_properties(self, data):
         obj = self.ExtendedStreamProperties()
-        obj.start_time      = data.read_uint64()
-        obj.end_time        = data.read_uint64()
-        obj.data_bitrate    = data.read_uint32()
-        obj.buffer_size     = data.read_uint32()
-        obj.initial_buffer_fullness  = data.read_uint32()
-        obj.alt_data_bitrate    = data.read_uint32()
-        obj.alt_buffer_size     = data.read_uint32()
-        obj.alt_initial_buffer_fullness = data.read_uint32()
-        obj.max_object_size     = data.read_uint32()
+        data.read_record(extended_stream_properties_layout, obj)
         
         # Parse flags
-        flags = data.read_uint32()
+        flags = obj.flags
         obj.reliable_flag   = flags & 0x01
         obj.seekable_flag   = (flags >> 1) & 0x01
         obj.no_cleanpoints_flag = (flags >> 2) & 0x01
         obj.resend_cleanpoints_flag = (flags >> 3) & 0x01
         obj.reserved_flags      = flags >> 4
         
-        obj.stream_number       = data.read_uint16()
-        obj.stream_language_id  = data.read_uint16()
-        obj.avg_time_per_frame  = data.read_uint64()
-        obj.stream_name_length  = data.read_uint16()
-        obj.payload_extension_length = data.read_uint16()
         obj.stream_names = None
         obj.payload_extensions = None
         obj.stream_properties_object = None
@@ -382,7 +429,7 @@ class Parser(plugins.BaseParser):
     def parse_codec_list(self, data):
         codeclist = self.CodecList()
         
-        codeclist.reserved = data.read_guid()
+        codeclist.reserved = data.read_guid_bytes()
         codeclist.num_codecs = data.read_uint32()
         codeclist.codec_entries = []
         
@@ -476,14 +523,15 @@ class Parser(plugins.BaseParser):
             return buffer
     
     class FileProperties(Structure):
-        __slots__ = ['id', 'size', 'create_data', 'packet_count',
-                     'play_duration', 'send_duration', 'preroll',
+        __slots__ = ['id', 'size', 'create_date', 'packet_count',
+                     'play_duration', 'send_duration', 'preroll', 'flags',
                      'broadcast_flag', 'seekable_flag', 'reserved',
                      'min_packet_size', 'max_packet_size', 'max_bitrate']
                      
         def __repr__(self):
             buffer  = "FileProperties Structure: \n"
-            buffer += " %-30s: %s\n" % ('File ID', self.id)
+            buffer += " %-30s: %s\n" % ('File ID',
+                                        streams.guid.to_string(self.id))
             buffer += " %-30s: %s\n" % ('File Size', self.size)
             buffer += " %-30s: %s\n" % ('Creation Date', self.create_date)
             buffer += " %-30s: %s\n" % ('Data Packets Count',
@@ -506,7 +554,8 @@ class Parser(plugins.BaseParser):
     class HeaderExtension(Structure):
         def __repr__(self):
             buffer  = "HeaderExtension Structure: \n"
-            buffer += " %-30s: %s\n" % ('Reserved_1', self.reserved_1)
+            buffer += " %-30s: %s\n" % ('Reserved_1',
+                                        streams.guid.to_string(self.reserved_1))
             buffer += " %-30s: %s\n" % ('Reserved_2', self.reserved_2)
             buffer += " %-30s: %s\n" % ('Header Extension Data Size',
                                         self.size)
@@ -568,7 +617,8 @@ class Parser(plugins.BaseParser):
         
         def __repr__(self):
             buffer  = "CodecList Structure: \n"
-            buffer += " %-30s: %s\n" % ('Reserved', self.reserved)
+            buffer += " %-30s: %s\n" % ('Reserved',
+                                        streams.guid.to_string(self.reserved))
             buffer += " %-30s: %s\n" % ('Codec Entries Count', self.num_codecs)
             buffer += " %-30s\n" % ('Codec Entries')
             buffer += self.repr_childs(self.codec_entries)
@@ -599,8 +649,9 @@ class Parser(plugins.BaseParser):
         __slots__ = ['start_time', 'end_time', 'data_bitrate', 'buffer_size',
                      'initial_buffer_fullness', 'alt_data_bitrate',
                      'alt_buffer_size', 'alt_initial_buffer_fullness',
-                     'max_object_size', 'reliable_flag', 'seekable_flag',
-                     'no_cleanpoints_flag', 'resend_cleanpoints_flag',
+                     'max_object_size', 'flags', 'reliable_flag',
+                     'seekable_flag', 'no_cleanpoints_flag',
+                     'resend_cleanpoints_flag',
                      'reserved_flags', 'stream_number', 'stream_language_id',
                      'avg_time_per_frame', 'stream_name_length',
                      'payload_extension_length', 'stream_names',
@@ -35,21 +35,50 @@ if __name__ == "__main__":
 import videoparser.plugins as plugins
 import videoparser.streams as streams
 
+# AVISTREAMHEADER
+streamheader_layout = streams.Layout([
+    ('type',                    '4s'),
+    ('handler',                 '4s'),
+    ('flags',                   'I'),
+    ('priority',                'H'),
+    ('language',                'H'),
+    ('initial_frames',          'I'),
+    ('scale',                   'I'),
+    ('rate',                    'I'),
+    ('start',                   'I'),
+    ('length',                  'I'),
+    ('suggested_buffer_size',   'I'),
+    ('quality',                 'I'),
+    ('sample_size',             'I'),
+    ('frame_left',              'B'),
+    ('frame_top',               'B'),
+    ('frame_right',             'B'),
+    ('frame_bottom',            'B'),
+])
+
+# AVIMAINHEADER
+mainheader_layout = streams.Layout([
+    ('ms_per_frame',            'I'),
+    ('max_bytes_per_frame',     'I'),
+    ('padding_granularity',     'I'),
+    ('flags',                   'I'),
+    ('total_frames',            'I'),
+    ('initial_frames',          'I'),
+    ('streams',                 'I'),
+    ('suggested_buffer_size',   'I'),
+    ('width',                   'I'),
+    ('height',                  'I'),
+    ('reserved',                'I'),
+])
+
 
 class Parser(plugins.BaseParser):
     """ Parser for AVI RIFF Containers """
     _endianess = streams.endian.little
-    _file_types = ['avi']
-    
-    def __init__(self):
-        plugins.BaseParser.__init__(self)
-        
-        self._parse_level = 0
-        self._last_stream_header = None
 
-    def parse(self, filename, video):
-        stream = streams.factory.create_filestream(filename,
-                                                   endianess=self._endianess)
+    def parse(self, stream, video, fields=None):
+        stream.set_endianess(self._endianess)
+        
 
         # Read fourcc
         if stream.read(4) != 'RIFF':
@@ -59,13 +88,23 @@ class Parser(plugins.BaseParser):
         filesize = stream.read_uint32()
         filetype = stream.read(4)
         
+        # The strf chunk is parsed according to the type of the strh chunk
+        # before it
+        context = plugins.ParseContext(last_stream_header=None)
+        
         # Parse the first block (which is a header)
         
-        header = self._parse_block(stream)
+        header = self._parse_block(stream, context)
         self._extract_information(header, video)
         return True
     
     
+    def fingerprint_regions(self, stream):
+        """ Only the RIFF header and the first block, the hdrl LIST, are
+            parsed. """
+        stream.seek(16)
+        return [(0, min(stream.get_size(), 20 + stream.read_uint32()))]
+    
     def _extract_information(self, header, video):
         
         video.set_container('AVI RIFF')
@@ -97,14 +136,32 @@ class Parser(plugins.BaseParser):
                                                           'Unknown'))
         
     
-    def _parse_block(self, stream):
+    def _parse_block(self, stream, context):
         id = stream.read(4)
+        
+        tracer = stream.tracer
+        if tracer is not None:
+            offset = stream.file_offset() - 4
+            size = stream.read_uint32() + 8
+            stream.seek(stream.tell() - 4)
+            if id == 'LIST':
+                handler = '_parse_list'
+            elif id in ['avih', 'strh', 'strf']:
+                handler = '_parse_chunk'
+            else:
+                handler = 'skip'
+            span = tracer.begin(id, 'avi', offset, size, handler)
+        
         if id == 'LIST':
-            return self._parse_list(stream)
+            block = self._parse_list(stream, context)
         else:
-            return self._parse_chunk(stream, id)
+            block = self._parse_chunk(stream, id, context)
+        
+        if tracer is not None:
+            tracer.end(span)
+        return block
             
-    def _parse_list(self, stream):
+    def _parse_list(self, stream, context):
         item = self.ListItem()
         item.size = stream.read_uint32()
         item.type = stream.read_dword()
@@ -114,13 +171,13 @@ class Parser(plugins.BaseParser):
         
         data = stream.read_subsegment(item.size-4 )
         while data.tell() < item.size - 4:
-            sub_item = self._parse_block(data)
+            sub_item = self._parse_block(data, context)
             item.childs.append(sub_item)
 
         
         return item
 
-    def _parse_chunk(self, stream, chunk_id):
+    def _parse_chunk(self, stream, chunk_id, context):
         
         chunk_size = stream.read_uint32()
         chunk_size += chunk_size % 2 # Align to dword
@@ -131,13 +188,13 @@ class Parser(plugins.BaseParser):
                 return self._parse_mainheader(data)
             
             elif chunk_id == 'strh':
-                return self._parse_streamheader(data)
+                return self._parse_streamheader(data, context)
                 
             elif chunk_id == 'strf':
-                if self._last_stream_header.type == 'vids':
+                if context.last_stream_header.type == 'vids':
                     return data.read_bitmapinfoheader()
 
-                elif self._last_stream_header.type == 'auds':
+                elif context.last_stream_header.type == 'auds':
                     return data.read_waveformatex()
 
                 else:
@@ -147,45 +204,15 @@ class Parser(plugins.BaseParser):
         
         return None
 
-    def _parse_streamheader(self, data):
-        header = self.AVIStreamHeader()
-        header.type = data.read(4)
-        header.handler = data.read(4)
-        header.flags = data.read_uint32()
-        header.priority = data.read_uint16()
-        header.language = data.read_uint16()
-        header.initial_frames = data.read_uint32()
-        header.scale = data.read_uint32()
-        header.rate  = data.read_uint32()
-        header.start = data.read_uint32()
-        header.length = data.read_uint32()
-        header.suggested_buffer_size = data.read_uint32()
-        header.quality = data.read_uint32()
-        header.sample_size = data.read_uint32()
-        header.frame_left = data.read_uint8()
-        header.frame_top = data.read_uint8()
-        header.frame_right = data.read_uint8()
-        header.frame_bottom = data.read_uint8()
+    def _parse_streamheader(self, data, context):
+        header = data.read_record(streamheader_layout, self.AVIStreamHeader())
         
-        self._last_stream_header = header
+        context.last_stream_header = header
         return header
         
     
     def _parse_mainheader(self, data):
-        header = self.AVIMainHeader()
-        header.ms_per_frame         = data.read_uint32()
-        header.max_bytes_per_frame  = data.read_uint32()
-        header.padding_granularity  = data.read_uint32()
-        header.flags                = data.read_uint32()
-        header.total_frames         = data.read_uint32()
-        header.initial_frames       = data.read_uint32()
-        header.streams              = data.read_uint32()
-        header.suggested_buffer_size    = data.read_uint32()
-        header.width        = data.read_uint32()
-        header.height       = data.read_uint32()
-        header.reserved     = data.read_uint32()
-        
-        return header
+        return data.read_record(mainheader_layout, self.AVIMainHeader())
 
 
     class ListItem(object):
@@ -110,17 +110,13 @@ class_ids = {
 
 class Parser(plugins.BaseParser):
     _endianess = streams.endian.big
-    _file_types = ['mkv']
     
     def __init__(self, *args, **kwargs):
         plugins.BaseParser.__init__(self, *args, **kwargs)
 
         
-    def parse(self, filename, video):
-        
-        
-        stream = streams.factory.create_filestream(filename,
-                                                   endianess=self._endianess)
+    def parse(self, stream, video, fields=None):
+        stream.set_endianess(self._endianess)
 
         # Check if this is an EBML file
         if stream.read_uint32() != 0x1a45dfa3:
@@ -129,13 +125,13 @@ class Parser(plugins.BaseParser):
         
         video.set_container('matroska')
         
-        tree = self._build_tree(stream)
+        tree = self._build_tree(stream, video)
         self._extract_information(tree, video)
     
         return True
 
 
-    def _build_tree(self, stream):
+    def _build_tree(self, stream, video):
         """ Iterate over all the elements in the file and create a tree out of
             it. """
 
@@ -148,7 +144,7 @@ class Parser(plugins.BaseParser):
         previous_element.level = -1
         root_elm = previous_element
         
-        for elm in self.parse_header(stream):
+        for elm in self.parse_header(stream, video):
             if elm is None:
                 continue
 
@@ -209,87 +205,117 @@ class Parser(plugins.BaseParser):
             
     
     
-    def parse_header(self, stream):
+    def parse_header(self, stream, video):
         
         # Elements incorporate an Element ID, a descriptor for the size of the
         # element, and the binary data itself.
+        reader = streams.ebml.Reader(stream)
         
-        while stream.bytes_left():
-            # Fetch the element id
-            octet = stream.read_byte()
-            
-            classid_size, classid_bytes = self.parse_octet(octet)
+        # Unknown class-ids are counted and reported once at the end, with
+        # the offset of the first element
+        unhandled = {}
+        
+        # The spans of the elements which contain the position, with their
+        # level and the offset of their end
+        tracer = stream.tracer
+        spans = []
+        
+        try:
+            while reader.bytes_left():
+                start = reader.tell()
+                class_id, length = reader.read_element_header()
+                if tracer is not None:
+                    self._trace_element(tracer, spans, stream, start,
+                                        reader.tell(), class_id, length)
             
-            # Read all the bytes from the complete class-id:
-            if classid_size > 1:
-                class_id = stream.convert_uintvar(octet +
-                                                  stream.read(classid_size-1))
-            else:
-                class_id = ord(octet)
+                try:
+                    class_name, class_type, class_level = class_ids[class_id]
+                except KeyError:
+                    #raise AssertionError("Unhandled class-id: %s" % hex(class_id))
+                    if class_id in unhandled:
+                        unhandled[class_id][1] += 1
+                    else:
+                        unhandled[class_id] = [start, 1]
+                
+                    # Elements with an unknown size can't be skipped, their
+                    # children are parsed instead
+                    if length is not None:
+                        reader.skip(length)
+                    continue
             
-            # Fetch the descriptor for the size of the element
-            octet = stream.read_byte()
-            length_bytes, length =  self.parse_octet(octet)
-            length = stream.convert_uintvar(chr(length) +
-                                            stream.read(length_bytes-1))
+                if length is None and class_type != types.sub_elements:
+                    raise AssertionError("Unknown size for element %s" %
+                                         class_name)
             
-            try:
                 value = None
-                class_name, class_type, class_level = class_ids[class_id]
-                
                 if class_type == types.string:
-                    value = stream.read(length)
-                    
+                    value = reader.read_string(length)
+                
                 elif class_type == types.u_integer:
-                    value = stream.convert_uintvar(stream.read(length))
-    
+                    value = reader.read_unsigned(length)
+
                 elif class_type == types.binary:
-                    stream.seek(stream.tell() + length)
-                
+                    reader.skip(length)
+            
                 elif class_type == types.float:
-                    value = stream.read_float()
-                    
+                    value = reader.read_float(length)
+                
                 elif class_type == types.utf_8:
-                    value = stream.read(length)
-                    
+                    value = reader.read_string(length)
+                
                 elif class_type == types.sub_elements:
-                    if class_name in ['Info', 'SeekHead', 'Cluster', 'Cues']:
-                        stream.seek(stream.tell() + length)
+                    # The tracks are described before the first cluster, the
+                    # rest of the file isn't read in forward only mode
+                    if class_name == 'Cluster' and stream.forward_only:
+                        break
+                
+                    if class_name in ['Info', 'SeekHead', 'Cluster', 'Cues'] and \
+                       length is not None:
+                        reader.skip(length)
                         continue
-                    
-                yield (class_name, value, class_level)
                 
-            except KeyError:
-                #raise AssertionError("Unhandled class-id: %s" % hex(class_id))
-                print "Unhandled class-id: %s" % hex(class_id)
-                continue
-    
+                yield (class_name, value, class_level)
+        finally:
+            # Also when _build_tree stops early
+            while spans:
+                tracer.end(spans.pop()[0])
+            
+            for class_id, (offset, count) in sorted(unhandled.iteritems()):
+                self.warn(video, "Unhandled class-id: %s" % hex(class_id),
+                          offset=offset, count=count)
     
-    def parse_octet(self, octet):
-        """ Retrieve the length of the class-id. """
-        
-        octet = ord(octet)
 
-        # The bytesize of the class-id is the number of leading 0 bits + 1
-        # The value stored in this byte is with the marker bit removed (which
-        #  is the highest bit)
+    def _trace_element(self, tracer, spans, stream, start, data_start,
+                       class_id, length):
+        """ End the spans of the elements which end before start and begin
+            one for the element at start. Elements with an unknown size end
+            at the next element of the same or a higher level. """
+        try:
+            class_name, class_type, class_level = class_ids[class_id]
+        except KeyError:
+            class_name, class_type, class_level = hex(class_id), None, None
         
-        if octet == 0x00:
-            return (None, None)
-
-        # Calculate the length of the class-id            
-        mask = 0x80
-        length = 1
-        while mask:
-            if octet & mask:
+        end = None
+        if length is not None:
+            end = data_start + length
+        
+        while spans:
+            span, level, span_end = spans[-1]
+            if span_end is not None:
+                if start < span_end:
+                    break
+            elif class_level is None or class_level > level:
                 break
-
-            length += 1
-            mask >>= 1
-
-        # return the bytesize and the value with the marker bit xor'ed out
-        return (length, octet ^ 2**(8-length))
-
+            tracer.end(span)
+            spans.pop()
+        
+        handler = None
+        if class_type in (None, types.binary):
+            handler = 'skip'
+        
+        span = tracer.begin(class_name, 'matroska', stream.file_offset(start),
+                            end and end - start, handler, level=class_level)
+        spans.append((span, class_level, end))
 
     class LevelElement(object):
         __slots__ = ['key', 'value', 'level', 'childs', 'parent'    ]
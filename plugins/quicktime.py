@@ -34,12 +34,15 @@ if __name__ == "__main__":
 
 import datetime
 import binascii
+import logging
 
 # Project modules
 import videoparser.plugins as plugins
 import videoparser.streams as streams
 import struct
 
+log = logging.getLogger(__name__)
+
 # Define the structure of the movie atom
 atom_structure = {
 	'ftyp':     ('Description', "validate_file_format"),	
@@ -111,23 +114,85 @@ atom_structure = {
 	'wide':     ('Description', None),
 	'mdat':     ('Description', None),
 }
+
+# Fixed size atoms
+movie_header_layout = streams.Layout([
+	('version',             'B'),
+	('flags',               '3s'),
+	('creation_time',       'I', streams.layout.mac_timestamp),
+	('modification_time',   'I', streams.layout.mac_timestamp),
+	('timescale',           'I'),
+	('duration',            'I'),
+	('preferred_rate',      'I'),
+	('preferred_volume',    'H'),
+	('reserved_1',          '10s'),
+	('matrix',              '36s'),
+	('preview_time',        'I'),
+	('preview_duration',    'I'),
+	('poster_time',         'I'),
+	('selection_time',      'I'),
+	('selection_duration',  'I'),
+	('current_time',        'I'),
+	('next_track_id',       'I'),
+])
+
+track_header_layout = streams.Layout([
+	('version',             'B'),
+	('flags',               '3s'),
+	('creation_time',       'I', streams.layout.mac_timestamp),
+	('modification_time',   'I', streams.layout.mac_timestamp),
+	('track_id',            'I'),
+	('reserved_1',          '4s'),
+	('duration',            'I'),
+	('reserved_2',          '8s'),
+	('layer',               'H'),
+	('alt_group',           'H'),
+	('volume',              'H'),
+	('reserved_3',          '2s'),
+	('matrix',              '36s'),
+	('width',               'i', streams.layout.qt_fixed),
+	('height',              'i', streams.layout.qt_fixed),
+])
+
+media_header_layout = streams.Layout([
+	('version',             'B'),
+	('flags',               '3s'),
+	('creation_time',       'I', streams.layout.mac_timestamp),
+	('modification_time',   'I', streams.layout.mac_timestamp),
+	('timescale',           'I'),
+	('duration',            'I'),
+	('language',            '3s'),
+	('predefined',          'B'),
+])
+
+aperture_layout = streams.Layout([
+	('version',             'B'),
+	('flags',               '3s'),
+	('width',               'i', streams.layout.qt_fixed),
+	('height',              'i', streams.layout.qt_fixed),
+])
 	
 
 sourceTC = 0
 
 class Parser(plugins.BaseParser):
 	_endianess = streams.endian.big
-	_file_types = ['mov', 'mp4']
-
 	
-	def __init__(self):
-		plugins.BaseParser.__init__(self)
-		self._tkhd_subtype = None
-		self.sourceTC = -1
+	# Atoms, and extensions of the sample description, which are skipped
+	# when none of their fields are requested
+	field_dependencies = {
+		'stts':	['duration', 'framerate'],
+		'tapt':	['clean_aperture', 'prod_aperture', 'enc_aperture'],
+		'fiel':	['field_type', 'field_order'],
+		'colr':	['color_space'],
+		'pasp':	['pasp'],
+		'clap':	['clap'],
+		'gama':	['gamma'],
+		'chan':	['track_assignment'],
+	}
 		
-	def parse(self, filename, video):
-		stream = streams.factory.create_filestream(filename,
-												   endianess=self._endianess)
+	def parse(self, stream, video, fields=None):
+		stream.set_endianess(self._endianess)
 
 		# Make sure that we are dealing with a quicktime file format
 
@@ -140,10 +205,15 @@ class Parser(plugins.BaseParser):
 					
 		stream.seek(0)
 
+		# The subtype of the last handler reference atom is needed to parse
+		# the stsd atom, the timecode is found in a small mdat atom
+		context = plugins.ParseContext(tkhd_subtype=None, sourceTC=-1,
+									   fields=fields)
+		
 		# Build a tree with all information extracted
 		dest_tree = {}
 		try:
-			self.parse_atom(stream, atom_tree=atom_structure,
+			self.parse_atom(stream, context, atom_tree=atom_structure,
 							dest_tree=dest_tree)
 		except AssertionError:
 			raise
@@ -151,19 +221,73 @@ class Parser(plugins.BaseParser):
 
 		# Extract required information from the tree and place it in the
 		# videofile object
-		self.extract_information(dest_tree, video)
+		self.extract_information(dest_tree, video, context)
 		
 		video.set_container("QuickTime")
 		
 		return True
-	
+
+	def fingerprint_regions(self, stream):
+		""" The atoms which parse_atom reads, the sample tables and the media
+			data are skipped like they are by the parser. """
+		regions = []
+		self._atom_regions(stream, 0, stream.get_size(), atom_structure,
+						   regions)
+		return regions
+
+	def _atom_regions(self, stream, position, end, atom_tree, regions):
+		""" Add the regions of the atoms between position and end, in the
+			same way parse_atom walks them. Handled atoms are added whole,
+			of the other atoms only the header. A small mdat atom is added
+			whole since it may contain the timecode."""
+		while position + 8 <= end:
+			stream.seek(position)
+			atom_size = stream.read_uint32()
+			atom_type = stream.read(4)
+			atom_tree_item = atom_tree.get(atom_type)
+			skip = 8
+			if atom_size == 1:
+				atom_size = stream.read_uint64()
+				skip = 16
+			if atom_size == 0:
+				if atom_type == "mdat":
+					regions.append((position, skip))
+					break
+				atom_size = 8
+			atom_end = min(position + atom_size, end)
+			
+			# The parser reads the contents of unknown atoms as atoms
+			if not atom_tree_item:
+				regions.append((position, skip))
+				position += skip
+				continue
+			
+			item_arg = atom_tree_item[1]
+			if type(item_arg) == dict:
+				regions.append((position, skip))
+				self._atom_regions(stream, position + skip, atom_end,
+								   item_arg, regions)
+			elif item_arg or atom_type == "mdat" and atom_size == 12:
+				regions.append((position, atom_end - position))
+			else:
+				regions.append((position, skip))
+			position += max(atom_size, skip)
+
 	def parse_ftyp(self, data):
-		print repr(data)
+		log.debug("ftyp atom %r", data)
 		
-	def parse_atom(self, data, atom_tree=None, dest_tree=None):
+	def parse_atom(self, data, context, atom_tree=None, dest_tree=None):
 		filePos = 0
-
+		
+		# The span of an atom ends when the next atom is read
+		tracer = data.tracer
+		span = None
+		
 		while data.bytes_left():
+			if span is not None:
+				tracer.end(span)
+				span = None
+			
 			atom_data = None
 			atom_size = data.read_uint32()
 			atom_type = data.read(4)			
@@ -186,6 +310,12 @@ class Parser(plugins.BaseParser):
 					# Weird, but just continue to try to find more atoms
 					atom_size = 8
 			
+			if tracer is not None:
+				span = tracer.begin(atom_type, 'quicktime',
+									data.file_offset() - skip, atom_size,
+									self._trace_handler(context, atom_type,
+														atom_tree_item))
+			
 			#print str(atom_type) + ': ' + str(atom_size)
 			#break
 			#filePos = filePos + data.tell()
@@ -195,6 +325,10 @@ class Parser(plugins.BaseParser):
 				continue
 	
 			description, item_arg = atom_tree_item
+			
+			if not self.wanted(context.fields, atom_type):
+				data.seek(data.tell() + atom_size - skip)
+				continue
 
 			# Check if the atom is a container or contains data
 			childs = None
@@ -216,28 +350,47 @@ class Parser(plugins.BaseParser):
 				idx = len(dest_tree[atom_type]) - 1
 			#print atom_type
 			# Recurse
+			# Containers are read lazily, the child atoms which aren't
+			# parsed (like the sample tables) are never read
 			if childs:
-				atom_data = data.read_subsegment(atom_size - skip)
-				self.parse_atom(atom_data, atom_tree=atom_tree_item[1],
+				atom_data = data.read_window(atom_size - skip)
+				self.parse_atom(atom_data, context, atom_tree=atom_tree_item[1],
 								dest_tree=dest_tree[atom_type][idx])
 			
 			# Parse the data in the atom with the specified handler method
 			elif handler:				
 				atom_data = data.read_subsegment(atom_size - skip)
 				method = self.__class__.__getattribute__(self, handler)
-				dest_tree[atom_type] = method(atom_data)
+				dest_tree[atom_type] = method(atom_data, context)
 			
 			# Don't read the data, since we are not processing it
 			else:
 				#print str(atom_type) + ' ' + str(atom_size)
 				if atom_type == "mdat" and atom_size == 12:
 					atom_data = struct.unpack(">I", data.read(4))[0]
-					self.sourceTC = atom_data
+					context.sourceTC = atom_data
 				else:
 					atom_data = data.seek(data.tell() + atom_size - skip)
-			
+
+			# The moov atom holds everything which is needed, the rest of the
+			# file isn't read in forward only mode
+			if data.forward_only and 'moov' in dest_tree:
+				break
 		
-	def extract_information(self, tree, video):
+		if span is not None:
+			tracer.end(span)
+	
+	def _trace_handler(self, context, atom_type, atom_tree_item):
+		""" Name what parse_atom does with an atom, for the tracer. """
+		if not atom_tree_item:
+			return None
+		if not self.wanted(context.fields, atom_type):
+			return 'skip'
+		if type(atom_tree_item[1]) == dict:
+			return 'container'
+		return atom_tree_item[1] or 'skip'
+	
+	def extract_information(self, tree, video, context):
 		#print tree
 		duration = tree['moov'][0]['mvhd'].duration
 		timescale = tree['moov'][0]['mvhd'].timescale
@@ -261,9 +414,6 @@ class Parser(plugins.BaseParser):
 				stream.set_height(sample_table['height'])
 				# better timescale indicator
 				timescale = mdia_atom['mdhd'].timescale
-				# Calculate the framerate
-				stream_duration = 0
-				frames = 0
 
 				if 'tapt' in trak:
 					stream.set_clean_aperture((int(trak['tapt'][0]['clef'].width), int(trak['tapt'][0]['clef'].height)))
@@ -278,17 +428,17 @@ class Parser(plugins.BaseParser):
 					
 				else:
 				"""
-				for s_count, s_duration in sample_atom['stts'].sample_table:
-					stream_duration += (s_count * s_duration)
-					frames += s_count			
-				stream.set_framerate(timescale / (stream_duration /
-												  float(frames)))
-				stream.set_duration(seconds=frames / float(timescale / (stream_duration /
-												  float(frames))))
+				if 'stts' in sample_atom:
+					stream_duration = sample_atom['stts'].total_duration
+					frames = sample_atom['stts'].total_samples
+					stream.set_framerate(timescale / (stream_duration /
+													  float(frames)))
+					stream.set_duration(seconds=frames / float(timescale / (stream_duration /
+													  float(frames))))
 				#stream.set_duration(seconds=duration / float(timescale))
 				
 				
-				stream.set_sourceTC(self.sourceTC)
+				stream.set_sourceTC(context.sourceTC)
 				if sample_table['compressor'] == '':
 					if sample_table['format'] == 'apch':
 						stream.set_codec('Apple ProRes 422 (HQ)')
@@ -338,15 +488,12 @@ class Parser(plugins.BaseParser):
 				stream.set_bit_per_sample(sample_table['bits'])
 				#duration
 				audioTimescale = mdia_atom['mdhd'].timescale
-				stream_duration = 0
-				frames = 0
-				for s_count, s_duration in sample_atom['stts'].sample_table:
-					stream_duration += (s_count * s_duration)
-					frames += s_count
+				if 'stts' in sample_atom:
+					stream_duration = sample_atom['stts'].total_duration
+					stream.set_duration(seconds=stream_duration / float(audioTimescale))
 				
-				stream.set_duration(seconds=stream_duration / float(audioTimescale))
-				
-				stream.set_track_assignment(sample_table['audio_assignment'])
+				if 'audio_assignment' in sample_table:
+					stream.set_track_assignment(sample_table['audio_assignment'])
 
 			elif track_type == 'tmcd':
 				#2997
@@ -362,7 +509,7 @@ class Parser(plugins.BaseParser):
 		timecode = str(int(hh)).zfill(2) + ':' + str(int(mm)).zfill(2) + ':' + str(int(ss)).zfill(2) + ':' + str(int(ff)).zfill(2)
 		return timecode
 		
-	def validate_file_format(self, data):
+	def validate_file_format(self, data, context):
 		major_brand = data.read(4)
 		minor_version = data.read(4)
 
@@ -379,47 +526,13 @@ class Parser(plugins.BaseParser):
 	
 	
 
-	def parse_movie_header_atom(self, data):
-		obj = self.MovieHeaderAtom()
-		obj.version = data.read_uint8()
-		obj.flags = data.read(3)
-		obj.creation_time = data.read_timestamp_mac()
-		obj.modification_time = data.read_timestamp_mac()
-		obj.timescale = data.read_uint32()
-		obj.duration = data.read_uint32()
-		obj.preferred_rate = data.read_uint32()
-		obj.preferred_volume = data.read_uint16()
-		obj.reserved_1 = data.read(10)
-		obj.matrix = data.read(36)
-		obj.preview_time = data.read_uint32()
-		obj.preview_duration = data.read_uint32()
-		obj.poster_time = data.read_uint32()
-		obj.selection_time = data.read_uint32()
-		obj.selection_duration = data.read_uint32()
-		obj.current_time = data.read_uint32()
-		obj.next_track_id = data.read_uint32()
-		return obj
+	def parse_movie_header_atom(self, data, context):
+		return data.read_record(movie_header_layout, self.MovieHeaderAtom())
 
-	def parse_track_header_atom(self, data):
-		obj = self.TrackHeaderAtom()
-		obj.version = data.read_uint8()
-		obj.flags = data.read(3)
-		obj.creation_time = data.read_timestamp_mac()
-		obj.modification_time = data.read_timestamp_mac()
-		obj.track_id = data.read_uint32()
-		obj.reserved_1 = data.read(4)
-		obj.duration = data.read_uint32()
-		obj.reserved_2 = data.read(8)
-		obj.layer = data.read_uint16()
-		obj.alt_group = data.read_uint16()
-		obj.volume = data.read_uint16()
-		obj.reserved_3 = data.read(2)
-		obj.matrix = data.read(36)
-		obj.width = data.read_qtfloat_32()
-		obj.height = data.read_qtfloat_32()
-		return obj
+	def parse_track_header_atom(self, data, context):
+		return data.read_record(track_header_layout, self.TrackHeaderAtom())
 		
-	def parse_handler_reference_atom(self, data):
+	def parse_handler_reference_atom(self, data, context):
 		obj = self.HandlerReferenceAtom()
 		obj.version = data.read_uint8()
 		obj.flags = data.read(3)
@@ -433,65 +546,46 @@ class Parser(plugins.BaseParser):
 		# FIXME: This is a louse hack, but we need to know the subtype to parse
 		# the stsd atom correctly (subtype specifies if this is a sound or
 		# video track or something else (tmcd)
-		self._tkhd_subtype = obj.subtype
+		context.tkhd_subtype = obj.subtype
 		return obj
 
-	def parse_media_header_atom(self, data):
-		obj = self.MediaHeaderAtom()
-		obj.version = data.read_uint8()
-		obj.flags = data.read(3)
-		obj.creation_time = data.read_timestamp_mac()
-		obj.modification_time = data.read_timestamp_mac()
-		obj.timescale = data.read_uint32()
-		obj.duration = data.read_uint32()
-		obj.language = data.read(3)
-		obj.predefined = data.read_uint8()
-		return obj
+	def parse_media_header_atom(self, data, context):
+		return data.read_record(media_header_layout, self.MediaHeaderAtom())
 		
-	def parse_time_to_sample_atom(self, data):
+	def parse_time_to_sample_atom(self, data, context):
 		obj = self.TimeToSampleAtom()
 		obj.version = data.read_uint8()
 		obj.flags = data.read(3)
 		obj.num_entries = data.read_uint32()
-		obj.sample_table = []
-		for i in range(0, obj.num_entries):
-			obj.sample_table.append((data.read_uint32(), data.read_uint32()))
-
+		
+		# The table is read at once, entries are (sample count, duration) pairs
+		table = data.read_uint32_array(obj.num_entries * 2)
+		obj.sample_counts = table[0::2]
+		obj.sample_durations = table[1::2]
+		obj.total_samples = streams.arrays.total(obj.sample_counts)
+		obj.total_duration = streams.arrays.dot(obj.sample_counts,
+												obj.sample_durations)
 		return obj
 	
-	def parse_clean_aperture_atom(self, data):
-		obj = self.ApertureAtom()
-		obj.version = data.read_uint8()
-		obj.flags = data.read(3)
-		obj.width = data.read_qtfloat_32()
-		obj.height = data.read_qtfloat_32()
-		return obj
+	def parse_clean_aperture_atom(self, data, context):
+		return data.read_record(aperture_layout, self.ApertureAtom())
 
-	def parse_production_aperture_atom(self, data):
-		obj = self.ApertureAtom()
-		obj.version = data.read_uint8()
-		obj.flags = data.read(3)
-		obj.width = data.read_qtfloat_32()
-		obj.height = data.read_qtfloat_32()
-		return obj
+	def parse_production_aperture_atom(self, data, context):
+		return data.read_record(aperture_layout, self.ApertureAtom())
 			
-	def parse_encoded_aperture_atom(self, data):
-		obj = self.ApertureAtom()
-		obj.version = data.read_uint8()
-		obj.flags = data.read(3)
-		obj.width = data.read_qtfloat_32()
-		obj.height = data.read_qtfloat_32()
-		return obj
+	def parse_encoded_aperture_atom(self, data, context):
+		return data.read_record(aperture_layout, self.ApertureAtom())
 	
-	def parse_sample_descr_atom(self, data):
+	def parse_sample_descr_atom(self, data, context):
 		obj = self.SampleDescrAtom()
 		obj.version = data.read_uint8()
 		obj.flags = data.read(3)
 		obj.num_entries = data.read_uint32()
 		obj.sample_table = []
 			
-		assert(self._tkhd_subtype is not None)
+		assert(context.tkhd_subtype is not None)
 		for i in range(0, obj.num_entries):
+			start = data.tell()
 			size = data.read_uint32()
 			table_entry = {}
 			table_entry['size'] = size
@@ -501,7 +595,7 @@ class Parser(plugins.BaseParser):
 			table_entry['version'] = data.read_uint16()
 			table_entry['revision'] = data.read_uint16()
 			
-			if self._tkhd_subtype == 'vide':
+			if context.tkhd_subtype == 'vide':
 				table_entry['vendor'] =  repr(data.read_dword())
 				table_entry['temporal_quality'] =  data.read_int32()
 				table_entry['spatial_quality'] =  data.read_int32()
@@ -520,15 +614,21 @@ class Parser(plugins.BaseParser):
 
 				#temp_atom_size = data.read_int32()
 				#print temp_atom_size 
+				debug = log.isEnabledFor(logging.DEBUG)
 				while data.bytes_left():
 					temp_atom_size = data.read_uint16()	
-					print temp_atom_size
+					if debug:
+						log.debug("Sample description extension of %d bytes",
+								  temp_atom_size)
 					if temp_atom_size > 60 or temp_atom_size < 1:
 						pass
 					else:					 
 						sampdesc_ext = data.read(4) 
 						#print sampdesc_ext
-						if sampdesc_ext == 'fiel':
+						if sampdesc_ext in self.field_dependencies and \
+						   not self.wanted(context.fields, sampdesc_ext):
+							data.seek(data.tell() + temp_atom_size - 8)
+						elif sampdesc_ext == 'fiel':
 							table_entry['field_type'] = data.read_uint8()
 							table_entry['field_order'] = data.read_uint8()
 						elif sampdesc_ext == 'colr':						
@@ -553,7 +653,7 @@ class Parser(plugins.BaseParser):
 							break
 
 
-			if self._tkhd_subtype == 'soun':
+			if context.tkhd_subtype == 'soun':
 				#table_entry['reserved'] = data.read(12)
 				table_entry['vendor'] =  data.read_uint32()
 				table_entry['channels'] =  data.read_uint16()
@@ -562,7 +662,10 @@ class Parser(plugins.BaseParser):
 				table_entry['packet_size'] =  data.read_uint16()
 				table_entry['sample_rate'] =  data.read_qt_ufloat32()
 				
-				if data.bytes_left():
+				if not self.wanted(context.fields, 'chan'):
+					# Skip the rest of the entry with the channel layout
+					data.seek(min(start + size, data.get_size()))
+				elif data.bytes_left():
 					table_entry['samples_per_pack'] =  struct.unpack(">l", data.read(4))[0]
 					table_entry['bytes_per_pack'] =  struct.unpack(">l", data.read(4))[0]
 					table_entry['bytes_per_frame'] =  struct.unpack(">l", data.read(4))[0]
@@ -676,7 +779,7 @@ class Parser(plugins.BaseParser):
 							table_entry['audio_assignment'] = 'Mono x' + str(table_entry['channels'])
 				
 				
-			if self._tkhd_subtype == 'tmcd':
+			if context.tkhd_subtype == 'tmcd':
 				data.read(1)
 				data.read(1)
 				data.read(1)
@@ -752,6 +855,8 @@ class Parser(plugins.BaseParser):
 
 
 	class MovieHeaderAtom(object):
+		__slots__ = movie_header_layout.names
+
 		def __repr__(self):
 			buffer = "MovieHeaderAtom:\n"
 			buffer += " %-30s: %s\n" % ("Version", self.version)
@@ -774,6 +879,8 @@ class Parser(plugins.BaseParser):
 			return buffer
 
 	class ApertureAtom(object):
+		__slots__ = aperture_layout.names
+
 		def __repr__(self):
 			buffer = "AperturAtom:\n"
 			buffer += " %-30s: %s\n" % ("Version", self.version)
@@ -783,6 +890,8 @@ class Parser(plugins.BaseParser):
 			return buffer
 
 	class TrackHeaderAtom(object):
+		__slots__ = track_header_layout.names
+
 		def __repr__(self):
 			buffer = "TrackHeaderAtom:\n"
 			buffer += " %-30s: %s\n" % ("Version", self.version)
@@ -817,6 +926,8 @@ class Parser(plugins.BaseParser):
 			return buffer
 
 	class MediaHeaderAtom(object):
+		__slots__ = media_header_layout.names
+
 		def __repr__(self):
 			buffer = "MediaHeaderAtom:\n"
 			buffer += " %-30s: %s\n" % ("Version", self.version)
@@ -840,7 +951,7 @@ if __name__ == "__main__":
 	
 	video = videofile.VideoFile()
 	p = Parser()
-	if not p.parse(sys.argv[1], video):
+	if not p.parse_file(sys.argv[1], video):
 		print "This is not a quicktime file.."
 		sys.exit(1)
 		
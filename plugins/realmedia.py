@@ -35,16 +35,44 @@ import struct
 import videoparser.plugins as plugins
 import videoparser.streams as streams
 
+
+# Fixed size part of the version 0 PROP header
+fileproperties_layout = streams.Layout([
+    ('max_bit_rate',        'I'),
+    ('avg_bit_rate',        'I'),
+    ('max_packet_size',     'I'),
+    ('avg_packet_size',     'I'),
+    ('num_packets',         'I'),
+    ('duration',            'I'),
+    ('preroll',             'I'),
+    ('index_offset',        'I'),
+    ('data_offset',         'I'),
+    ('num_streams',         'H'),
+    ('flags',               'H'),
+])
+
+# Fixed size part of the version 0 MDPR header
+mediaproperties_layout = streams.Layout([
+    ('stream_number',       'H'),
+    ('max_bit_rate',        'I'),
+    ('avg_bit_rate',        'I'),
+    ('max_packet_size',     'I'),
+    ('avg_packet_size',     'I'),
+    ('start_time',          'I'),
+    ('preroll',             'I'),
+    ('duration',            'I'),
+    ('stream_name_size',    'B'),
+])
+
 class Parser(plugins.BaseParser):
     _endianess = streams.endian.big
-    _file_types = ['rm']
     
     def __init__(self):
         plugins.BaseParser.__init__(self)
 
-    def parse(self, filename, video):
-        stream = streams.factory.create_filestream(filename,
-                                                   endianess=self._endianess)
+    def parse(self, stream, video, fields=None):
+        stream.set_endianess(self._endianess)
+        
         if stream.read_fourcc() != '.RMF':
             return False
         stream.seek(0)
@@ -60,7 +88,15 @@ class Parser(plugins.BaseParser):
     def parse_objects(self, stream):
         objects = []
         
+        # The span of an object ends when the next object is read
+        tracer = stream.tracer
+        span = None
+        
         while stream.bytes_left():
+            if span is not None:
+                tracer.end(span)
+                span = None
+            
             id = stream.read_fourcc()
             size = stream.read_uint32()
             
@@ -68,7 +104,17 @@ class Parser(plugins.BaseParser):
             if id == '\x00\x00\x00\x00':
                 break
 
-            if id in ['.RMF', 'PROP', 'MDPR', 'CONT']: #, 'DATA']:
+            # The headers are before the data, the rest of the file isn't
+            # read in forward only mode
+            if id == 'DATA' and stream.forward_only:
+                break
+
+            handled = id in ['.RMF', 'PROP', 'MDPR', 'CONT'] #, 'DATA']
+            if tracer is not None:
+                span = tracer.begin(id, 'realmedia', stream.file_offset() - 8,
+                                    size, None if handled else 'skip')
+            
+            if handled:
                 data = stream.read_subsegment(size - 8)
             else:
                 stream.seek(stream.tell() + size - 8)
@@ -91,6 +137,8 @@ class Parser(plugins.BaseParser):
             #        print repr(data.read(10))
             objects.append(obj)
             
+        if span is not None:
+            tracer.end(span)
         return objects
 
 
@@ -130,17 +178,7 @@ class Parser(plugins.BaseParser):
         obj.version = data.read_uint16()
         
         if obj.version == 0:
-            obj.max_bit_rate = data.read_uint32()
-            obj.avg_bit_rate = data.read_uint32()
-            obj.max_packet_size = data.read_uint32()
-            obj.avg_packet_size = data.read_uint32()
-            obj.num_packets = data.read_uint32()
-            obj.duration = data.read_uint32()
-            obj.preroll = data.read_uint32()
-            obj.index_offset = data.read_uint32()
-            obj.data_offset = data.read_uint32()
-            obj.num_streams = data.read_uint16()
-            obj.flags = data.read_uint16()
+            data.read_record(fileproperties_layout, obj)
     
         return obj
     
@@ -150,15 +188,7 @@ class Parser(plugins.BaseParser):
         obj.version = data.read_uint16()
 
         if obj.version == 0:
-            obj.stream_number = data.read_uint16()
-            obj.max_bit_rate = data.read_uint32()
-            obj.avg_bit_rate = data.read_uint32()
-            obj.max_packet_size = data.read_uint32()
-            obj.avg_packet_size = data.read_uint32()
-            obj.start_time = data.read_uint32()
-            obj.preroll = data.read_uint32()
-            obj.duration = data.read_uint32()
-            obj.stream_name_size = data.read_uint8()
+            data.read_record(mediaproperties_layout, obj)
             obj.stream_name = data.read(obj.stream_name_size)
             obj.mime_type_size = data.read_uint8()
             obj.mime_type = data.read(obj.mime_type_size)
@@ -0,0 +1,122 @@
+"""Statistics of the parsing, the I/O and time spent per file and plugin"""
+#
+#  Copyright (c) 2007 Michael van Tellingen <michaelvantellingen@gmail.com>
+#  All rights reserved.
+#
+#  Redistribution and use in source and binary forms, with or without
+#  modification, are permitted provided that the following conditions
+#  are met:
+#  1. Redistributions of source code must retain the above copyright
+#     notice, this list of conditions and the following disclaimer.
+#  2. The name of the author may not be used to endorse or promote products
+#     derived from this software without specific prior written permission
+#
+#  THIS SOFTWARE IS PROVIDED BY THE AUTHOR ``AS IS'' AND ANY EXPRESS OR
+#  IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED WARRANTIES
+#  OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE DISCLAIMED.
+#  IN NO EVENT SHALL THE AUTHOR BE LIABLE FOR ANY DIRECT, INDIRECT,
+#  INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT
+#  NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE,
+#  DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY
+#  THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+#  (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF
+#  THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+#
+
+# Project modules
+import videoparser.streams as streams
+
+
+__all__ = ['ParseStats', 'Summary']
+
+
+class ParseStats(streams.IOStats):
+	""" Statistics of the parse of one file, collected when the VideoParser
+		is created with stats=True. The I/O counters are those of
+		streams.IOStats. attempts holds a (plugin, success, wall seconds,
+		cpu seconds) tuple for every plugin which was tried, in order. The
+		attempts are empty when the result was a copy from the dedup cache.
+		The cpu time is the time of the process, in the 'thread' mode of
+		parse_files it includes the other threads."""
+	
+	def __init__(self):
+		streams.IOStats.__init__(self)
+		self.attempts = []
+	
+	def add_attempt(self, plugin, success, wall, cpu):
+		self.attempts.append((plugin, success, wall, cpu))
+	
+	def to_dict(self):
+		""" Return the statistics as a dict of basic types. """
+		info = streams.IOStats.to_dict(self)
+		info['attempts'] = [{'plugin': plugin, 'success': success,
+							 'wall': wall, 'cpu': cpu}
+							for plugin, success, wall, cpu in self.attempts]
+		return info
+
+
+class Summary(object):
+	""" Totals of the statistics of many parses, for the report of a batch.
+	
+		Example:
+			parser = VideoParser(stats=True)
+			summary = Summary()
+			for filename, video in parser.parse_files(filenames):
+				summary.add(video)
+			print summary.report()"""
+	
+	def __init__(self):
+		self.files = 0
+		self.without_stats = 0
+		self.io = streams.IOStats()
+		
+		# Plugin name to a [attempts, successes, wall, cpu] list
+		self.plugins = {}
+	
+	def add(self, result):
+		""" Add the statistics of a result of VideoParser, a ParseError of
+			parse_files has those of the failed parse. Results without
+			statistics, like those from a cache and None, are counted as
+			such. """
+		stats = getattr(result, 'stats', None)
+		if stats is None:
+			self.without_stats += 1
+			return
+		
+		self.files += 1
+		self.io.add(stats)
+		for plugin, success, wall, cpu in stats.attempts:
+			totals = self.plugins.setdefault(plugin, [0, 0, 0.0, 0.0])
+			totals[0] += 1
+			totals[1] += bool(success)
+			totals[2] += wall
+			totals[3] += cpu
+	
+	def to_dict(self):
+		info = {'files': self.files, 'without_stats': self.without_stats}
+		info.update(self.io.to_dict())
+		info['plugins'] = dict(
+			(plugin, {'attempts': attempts, 'successes': successes,
+					  'wall': wall, 'cpu': cpu})
+			for plugin, (attempts, successes, wall, cpu)
+			in self.plugins.iteritems())
+		return info
+	
+	def report(self):
+		""" Return the totals as text, one line per plugin. """
+		io = self.io
+		lines = ["%d files with statistics, %d without" % (
+					self.files, self.without_stats),
+				 "%d reads of %d bytes, %d seeks over %d bytes, %d "
+				 "sub-segments of %d bytes" % (
+					io.read_calls, io.bytes_read, io.seeks, io.seek_distance,
+					io.subsegments, io.subsegment_bytes)]
+		
+		# The plugins which took the most time first
+		for plugin, (attempts, successes, wall, cpu) in sorted(
+				self.plugins.iteritems(), key=lambda item: -item[1][2]):
+			lines.append("%-10s %6d attempts %6d parsed %8.3fs wall "
+						 "%8.3fs cpu %8.3fms per attempt" % (
+							plugin, attempts, successes, wall, cpu,
+							wall * 1000.0 / attempts))
+		return "\n".join(lines)
@@ -22,8 +22,16 @@
 #  THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
 #
 
-from videoparser.streams.binary import BinaryStream
+from videoparser.streams.binary import BinaryStream, BufferStream, \
+                                       ForwardStream, MappedStream, ViewStream, \
+                                       WindowStream, Limits, LimitError, \
+                                       IOStats
+from videoparser.streams.layout import Layout
+from videoparser.streams import arrays
 from videoparser.streams import factory
+from videoparser.streams import guid
+from videoparser.streams import layout
+from videoparser.streams import ebml
 from videoparser.streams import endian
 
 
@@ -0,0 +1,89 @@
+""" Typed arrays for bulk reads of sample and index tables. """
+
+#
+#  Copyright (c) 2007 Michael van Tellingen <michaelvantellingen@gmail.com>
+#  All rights reserved.
+#
+#  Redistribution and use in source and binary forms, with or without
+#  modification, are permitted provided that the following conditions
+#  are met:
+#  1. Redistributions of source code must retain the above copyright
+#     notice, this list of conditions and the following disclaimer.
+#  2. The name of the author may not be used to endorse or promote products
+#     derived from this software without specific prior written permission
+#
+#  THIS SOFTWARE IS PROVIDED BY THE AUTHOR ``AS IS'' AND ANY EXPRESS OR
+#  IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED WARRANTIES
+#  OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE DISCLAIMED.
+#  IN NO EVENT SHALL THE AUTHOR BE LIABLE FOR ANY DIRECT, INDIRECT,
+#  INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT
+#  NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE,
+#  DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY
+#  THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+#  (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF
+#  THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+#
+
+import array
+import itertools
+import operator
+import sys
+
+# NumPy is optional, without it the tables are array.array objects
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+from videoparser.streams import endian
+
+
+__all__ = ['from_string', 'total', 'dot']
+
+
+if sys.byteorder == 'little':
+    _native = endian.little
+else:
+    _native = endian.big
+
+# array.array typecodes per item size, the size of 'L' and 'I' is platform
+# dependent
+_typecodes = {}
+for _code in 'BHILQ':
+    try:
+        _typecodes.setdefault(array.array(_code).itemsize, _code)
+    except ValueError:
+        pass
+
+_dtypes = {1: 'u1', 2: 'u2', 4: 'u4', 8: 'u8'}
+
+
+def from_string(data, itemsize, endianess):
+    """ Convert a string of unsigned integers of itemsize bytes to an array,
+        a NumPy array when NumPy is available otherwise an array.array in
+        native byte order."""
+    if numpy is not None:
+        if endianess == endian.big:
+            dtype = '>' + _dtypes[itemsize]
+        else:
+            dtype = '<' + _dtypes[itemsize]
+        return numpy.frombuffer(data, dtype=dtype)
+
+    values = array.array(_typecodes[itemsize], data)
+    if endianess != _native and itemsize > 1:
+        values.byteswap()
+    return values
+
+
+def total(values):
+    """ Sum of all the values in an array. """
+    if numpy is not None:
+        return int(values.sum(dtype=numpy.uint64))
+    return sum(values)
+
+
+def dot(a, b):
+    """ Sum of the products of the values in a and b. """
+    if numpy is not None:
+        return int(numpy.dot(a.astype(numpy.uint64), b.astype(numpy.uint64)))
+    return sum(itertools.imap(operator.mul, a, b))
@@ -29,41 +29,312 @@
 
 
 import datetime
-
+import logging
 import struct
-import cStringIO
 
 
+from videoparser.streams import arrays
 from videoparser.streams import endian
+from videoparser.streams import guid
+from videoparser.streams.layout import Layout
+
+
+log = logging.getLogger(__name__)
+
+
+waveformatex_layout = Layout([
+    ('codec_id',            'H'),
+    ('channels',            'H'),
+    ('sample_rate',         'I'),
+    ('bit_rate',            'I'),
+    ('block_alignment',     'H'),
+    ('bits_per_sample',     'H'),
+    ('codec_size',          'H'),
+])
+
+bitmapinfoheader_layout = Layout([
+    ('format_data_size',    'I'),
+    ('image_width',         'I'),
+    ('image_height',        'I'),
+    ('reserved',            'H'),
+    ('bpp',                 'H'),
+    ('compression_id',      '4s'),
+    ('image_size',          'I'),
+    ('h_pixels_meter',      'I'),
+    ('v_pixels_meter',      'I'),
+    ('colors',              'I'),
+    ('important_colors',    'I'),
+])
+
+
+class LimitError(Exception):
+    """ Raised for an element which doesn't fit in its parent or the file, or
+        exceeds the Limits of the stream. The size read from the file is
+        corrupt, or the file is made to exhaust the memory."""
+
+
+class Limits(object):
+    """ Memory limits of one parse, shared by a stream and the sub-streams
+        created from it. max_element_size is the largest element which is
+        read into memory at once, byte_budget the total number of bytes the
+        parsers read from the file or buffer, the data skipped in a forward
+        only stream included. None is no limit. The read-ahead of the
+        streams isn't counted, the bytes are charged when the stream at the
+        root hands them to the parser."""
+    
+    def __init__(self, max_element_size=None, byte_budget=None):
+        self.max_element_size = max_element_size
+        self.byte_budget = byte_budget
+        self.used = 0
+    
+    def check_element(self, length):
+        if self.max_element_size is not None and \
+           length > self.max_element_size:
+            raise LimitError("Element of %d bytes exceeds the maximum "
+                             "element size of %d bytes" %
+                             (length, self.max_element_size))
+    
+    def charge(self, length):
+        """ Count length bytes read from the file object to the budget."""
+        self.used += length
+        if self.byte_budget is not None and self.used > self.byte_budget:
+            raise LimitError("Reading %d bytes exceeds the budget of %d "
+                             "bytes" % (length, self.byte_budget))
+
+
+class IOStats(object):
+    """ I/O counters of one parse, shared by a stream and the sub-streams
+        created from it. read_calls and bytes_read count the reads on the
+        file object, seeks and seek_distance the seeks on it, data skipped in
+        a forward only stream counts as a seek. subsegments and
+        subsegment_bytes count the sub-segments copied into memory, views on
+        data which is already in memory aren't counted."""
+    
+    fields = ('read_calls', 'bytes_read', 'seeks', 'seek_distance',
+              'subsegments', 'subsegment_bytes')
+    
+    def __init__(self):
+        self.read_calls = 0
+        self.bytes_read = 0
+        self.seeks = 0
+        self.seek_distance = 0
+        self.subsegments = 0
+        self.subsegment_bytes = 0
+    
+    def add(self, other):
+        """ Add the counters of other to these counters."""
+        for name in self.fields:
+            setattr(self, name, getattr(self, name) + getattr(other, name))
+    
+    def to_dict(self):
+        return dict((name, getattr(self, name)) for name in self.fields)
 
 
 class BinaryStream(object):
+    """ Stream on a file object. Reads are served from an aligned read-ahead
+        window of window bytes, so the many small reads and seeks of the
+        header parsers result in a few large reads on the file object.
+        read_calls and bytes_read count the reads done on the file object."""
     
-    def __init__(self, fileobj, filesize, endianess=endian.little):
+    # Set on streams which can't seek back, the plugins stop reading as soon
+    # as they found the information they need
+    forward_only = False
+    
+    # The Limits and IOStats of the parse, set with set_limits() and
+    # set_stats()
+    _limits = None
+    _stats = None
+    
+    # The Limits with a byte budget which the reads of this stream are
+    # charged to. Only set on the stream at the root, the data of the
+    # sub-streams was charged when it was read from the root.
+    _budget = None
+    
+    # The Tracer of the parse, set with set_tracer(), and the offset of the
+    # stream in the file when it's traced
+    tracer = None
+    _base = 0
+    
+    # Cleared on sub-streams which end before the end of the file. Elements
+    # which run past the end of the file are cut off by a truncated file,
+    # they are read up to the end instead of raising a LimitError.
+    _at_end = True
+    
+    def __init__(self, fileobj, filesize, endianess=endian.little,
+                 window=65536):
         self._endianess = endianess
         self._fileobj = fileobj
         self._filesize = filesize
         
+        self._window_size = window
+        self._window = ''
+        self._window_start = 0
+        self._position = 0
+        self._file_position = None
+        
+        self.read_calls = 0
+        self.bytes_read = 0
+        
     def __del__(self):
         self.close()
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
         
     def read(self, length):
+        if length < 0:
+            length = max(self._filesize - self._position, 0)
         if not length:
             return ''
+        if self._budget is not None:
+            self._budget.charge(
+                min(length, max(self._filesize - self._position, 0)))
         
-        return self._fileobj.read(length)
+        # Served from the window, which may also hold the end of the file
+        start = self._position - self._window_start
+        window_length = len(self._window)
+        if start >= 0 and (start + length <= window_length or
+                           self._window_start + window_length >=
+                           self._filesize):
+            data = self._window[start:start + length]
+            self._position += len(data)
+            return data
+        
+        # Large reads bypass the window, a corrupt length isn't allocated.
+        # The start of the data which is in the window isn't read again.
+        if not self._window_size or length >= self._window_size:
+            length = min(length, max(self._filesize - self._position, 0))
+            data = ''
+            if 0 <= start < window_length:
+                data = self._window[start:]
+            data += self._read_file(self._position + len(data),
+                                    length - len(data))
+            self._position += len(data)
+            
+            # The end of the data becomes the window, for the reads after it
+            if self._window_size:
+                self._window = data[-self._window_size:]
+                self._window_start = self._position - len(self._window)
+            return data
+        
+        # Load the aligned window(s) containing the requested data, the
+        # part of it which is in the window already isn't read again
+        window_start = self._position - self._position % self._window_size
+        window_end = self._position + length + self._window_size - 1
+        window_end -= window_end % self._window_size
+        if 0 <= start <= window_length:
+            window = self._window[start:]
+            window_start = self._position
+            self._window = window + self._read_file(
+                window_start + len(window),
+                window_end - window_start - len(window))
+        else:
+            self._window = self._read_file(window_start,
+                                           window_end - window_start)
+        self._window_start = window_start
+        
+        start = self._position - window_start
+        data = self._window[start:start + length]
+        self._position += len(data)
+        return data
+    
+    def _read_file(self, position, length):
+        """ Read length bytes at position from the file object. """
+        stats = self._stats
+        if self._file_position != position:
+            if stats is not None and self._file_position is not None:
+                stats.seeks += 1
+                stats.seek_distance += abs(position - self._file_position)
+            self._fileobj.seek(position)
+        
+        data = self._fileobj.read(length)
+        self._file_position = position + len(data)
+        
+        self.read_calls += 1
+        self.bytes_read += len(data)
+        if stats is not None:
+            stats.read_calls += 1
+            stats.bytes_read += len(data)
+        return data
 
     def tell(self):
-        return self._fileobj.tell()
+        return self._position
     
     def seek(self, position):
-        return self._fileobj.seek(position)
+        self._position = position
     
     def close(self):
-        return self._fileobj.close()
+        self._window = ''
+        if self._fileobj is not None:
+            self._fileobj.close()
+            self._fileobj = None
+    
+    def detach(self):
+        """ Release the file object without closing it and return it, the
+            stream can't be used afterwards. """
+        fileobj, self._fileobj = self._fileobj, None
+        self._window = ''
+        return fileobj
 
     def bytes_left(self):
-        return self._fileobj.tell() < self._filesize
+        return self._position < self._filesize
+
+    def get_size(self):
+        return self._filesize
+    
+    def set_limits(self, limits):
+        """ Enforce limits, a Limits object, on this stream and the streams
+            created from it."""
+        self._limits = limits
+        if limits.byte_budget is not None:
+            self._budget = limits
+    
+    def set_stats(self, stats):
+        """ Count the I/O of this stream and the streams created from it in
+            stats, an IOStats object."""
+        self._stats = stats
+    
+    def set_tracer(self, tracer):
+        """ Record the elements parsed from this stream and the streams
+            created from it in tracer, a Tracer object."""
+        self.tracer = tracer
+    
+    def file_offset(self, position=None):
+        """ Return the offset in the file of position in this stream, by
+            default the current position. Only known when the stream is
+            traced."""
+        if position is None:
+            position = self.tell()
+        return self._base + position
+    
+    def check_extent(self, length):
+        """ Return the number of bytes of an element of length bytes at the
+            position which are in the stream. A LimitError is raised when the
+            element doesn't fit in the stream, unless the stream ends at the
+            end of a truncated file."""
+        if length < 0:
+            raise LimitError("Invalid element size %d at offset %d" %
+                             (length, self.tell()))
+        
+        size = self.get_size()
+        if size is not None and length > size - self.tell():
+            if not self._at_end:
+                raise LimitError("Element of %d bytes at offset %d exceeds "
+                                 "the size %d of the stream" %
+                                 (length, self.tell(), size))
+            length = max(size - self.tell(), 0)
+        return length
+    
+    def check_element(self, length):
+        """ Like check_extent, and raise a LimitError when the element is
+            too large to read into memory."""
+        length = self.check_extent(length)
+        if self._limits is not None:
+            self._limits.check_element(length)
+        return length
 
     def set_endianess(self, endianess):
         self._endianess = endianess
@@ -84,10 +355,19 @@ class BinaryStream(object):
             else:
                 return struct.unpack('<' + type, data)[0]
         except struct.error:
-            print len(data)
-            print "Unable to unpack '%r'" % data
+            log.debug("Unable to unpack %d bytes %r as %r", len(data), data,
+                      type)
             raise
         
+    def read_record(self, layout, obj):
+        """ Read a fixed size record described by a streams.Layout with one
+            read and fill the fields in obj."""
+        data = self.read(layout.size)
+        
+        assert len(data) == layout.size, "Unexpected end of stream"
+        
+        return layout.unpack_from(data, 0, obj, self._endianess)
+        
     def read_float(self):
         """ Read a 32bit float."""
         return self.unpack('f', 4)
@@ -134,6 +414,25 @@ class BinaryStream(object):
         """ Read a signed 8bit integer."""
         return struct.unpack('b', self.read(1))[0]
     
+    def read_uint16_array(self, count):
+        """ Read count unsigned 16bit integers with one read, see
+            streams.arrays for the returned type."""
+        return arrays.from_string(self._read_exactly(count * 2), 2,
+                                  self._endianess)
+    
+    def read_uint32_array(self, count):
+        """ Read count unsigned 32bit integers with one read, see
+            streams.arrays for the returned type."""
+        return arrays.from_string(self._read_exactly(count * 4), 4,
+                                  self._endianess)
+    
+    def _read_exactly(self, length):
+        data = self.read(length)
+        
+        assert len(data) == length, "Unexpected end of stream"
+        
+        return data
+    
     def read_dword(self):
         return self.read(4)
     
@@ -176,9 +475,61 @@ class BinaryStream(object):
             return unicode(data, "UTF-16-LE")
     
     def read_subsegment(self, length):
+        """ Read length bytes once and return them as a BufferStream, nested
+            sub-segments of the result are views on the same data."""
+        size = self.get_size()
+        if length < 0 or self._limits is not None or \
+           size is not None and length > size - self.tell():
+            length = self.check_element(length)
         data = self.read(length)
-        return BinaryStream(cStringIO.StringIO(data), len(data),
-                            self._endianess)
+        
+        # The sub-segment is short when a forward only stream ends early,
+        # the parser gets the data which is there
+        if self._stats is not None:
+            self._stats.subsegments += 1
+            self._stats.subsegment_bytes += len(data)
+        return self._child(BufferStream(data, 0, len(data), self._endianess),
+                           self.tell() - len(data))
+    
+    def read_window(self, length):
+        """ Return a WindowStream on the next length bytes without reading
+            them, the data is read from this stream when the window is
+            read."""
+        start = self.tell()
+        if not 0 <= length <= self._filesize - start:
+            length = self.check_extent(length)
+        self.seek(start + length)
+        return self._child(WindowStream(self, start, length,
+                                        self._endianess), start)
+    
+    def _child(self, stream, start):
+        """ Return stream, a sub-stream of this stream at position start,
+            with the same limits."""
+        if self._limits is not None:
+            stream._limits = self._limits
+        if self._stats is not None:
+            stream._stats = self._stats
+        if self.tracer is not None:
+            stream.tracer = self.tracer
+            stream._base = self._base + start
+        if self._at_end:
+            # The end isn't known before a forward only stream reaches it
+            size = self.get_size()
+            if size is None or start + stream.get_size() < size:
+                stream._at_end = False
+        else:
+            stream._at_end = False
+        return stream
+    
+    def read_at(self, position, length):
+        """ Read length bytes at position, the position of the stream is
+            not changed."""
+        current = self._position
+        self._position = position
+        try:
+            return self.read(length)
+        finally:
+            self._position = current
     
     def convert_uintvar(self, data, endianess=None):
         """ Convert a string of variable length to an integer """
@@ -202,69 +553,23 @@ class BinaryStream(object):
 
     # ASF Specification requires the guid type, which is 128 bits aka 16 bytes
     def read_guid(self):
-        # See http://www.ietf.org/rfc/rfc4122.txt for specification
-        # The version number is in the most significant 4 bits of the time
-        # stamp (bits 4 through 7 of the time_hi_and_version field).
-        # Python 2.5 includes a built-in guid module, which should be used
-        
-        
-        # retrieve version        
-        position = self.tell()
-        self.seek(position + 6)
-        version = self.read_uint16() >> 12
-        self.seek(position)
-        
-        #print repr([hex(ord(x)) for x in self.read(16)])
-        
-        self.seek(position)
-        
-        time_low = self.read_uint32() 
-        time_mid = self.read_uint16()
-        time_hi  = self.read_uint16()
-        clock_seq_hi    = self.read_uint8()
-        clock_seq_low   = self.read_uint8()
-        node            = self.read(6)
-        
-        #print "uuid version = %d - %X" % (version, time_low)
-        if version == 1:
-            node = self.convert_uintvar(node, endian.big)
-        else:
-            node = self.convert_uintvar(node, endian.big)
-        
-        return "%08X-%04X-%04X-%X%X-%012X" % (time_low,
-                                            time_mid,
-                                            time_hi,
-                                            clock_seq_hi,
-                                            clock_seq_low,
-                                            node)
+        """ Read a GUID and return it in its string form."""
+        return guid.to_string(self.read_guid_bytes())
+    
+    def read_guid_bytes(self):
+        """ Read a GUID as the raw 16 bytes, use these as key in lookup tables
+            and only convert them with streams.guid.to_string() when the
+            string form is needed."""
+        return self._read_exactly(16)
                                      
     def read_waveformatex(self):
-        obj = self.WAVEFORMATEX()
-        
-        obj.codec_id = self.read_uint16()
-        obj.channels = self.read_uint16()
-        obj.sample_rate = self.read_uint32()
-        obj.bit_rate = self.read_uint32()
-        obj.block_alignment = self.read_uint16()
-        obj.bits_per_sample = self.read_uint16()
-        obj.codec_size = self.read_uint16()
+        obj = self.read_record(waveformatex_layout, self.WAVEFORMATEX())
         obj.codec_data = self.read_subsegment(obj.codec_size)
         return obj
     
     def read_bitmapinfoheader(self):
-        obj = self.BITMAPINFOHEADER()
-        
-        obj.format_data_size    = self.read_uint32()
-        obj.image_width         = self.read_uint32()
-        obj.image_height        = self.read_uint32()
-        obj.reserved            = self.read_uint16()
-        obj.bpp                 = self.read_uint16()
-        obj.compression_id      = self.read(4)
-        obj.image_size          = self.read_uint32()
-        obj.h_pixels_meter      = self.read_uint32()
-        obj.v_pixels_meter      = self.read_uint32()
-        obj.colors              = self.read_uint32()
-        obj.important_colors    = self.read_uint32()
+        obj = self.read_record(bitmapinfoheader_layout,
+                               self.BITMAPINFOHEADER())
         obj.codec_data          = self.read_subsegment(obj.format_data_size -
                                                        40)
         
@@ -321,3 +626,309 @@ class BinaryStream(object):
             
             return buffer    
 
+
+
+class BufferStream(BinaryStream):
+    """ BinaryStream over an in-memory buffer.
+    
+        The stream is a window (offset, length) on the buffer, positions
+        returned by tell() and accepted by seek() are relative to the start of
+        the window. Sub-segments are new windows on the same buffer, so nested
+        containers are parsed without copying the data again."""
+    
+    def __init__(self, buffer, offset=0, length=None,
+                 endianess=endian.little):
+        if length is None:
+            length = len(buffer) - offset
+        BinaryStream.__init__(self, None, length, endianess)
+        self._buffer = buffer
+        self._offset = offset
+        self._position = offset
+        self._end = offset + length
+    
+    def read(self, length):
+        if not length:
+            return ''
+        
+        start = self._position
+        if length < 0:
+            end = self._end
+        else:
+            end = min(start + length, self._end)
+        if self._budget is not None and end > start:
+            self._budget.charge(end - start)
+        self._position = max(start, end)
+        return self._buffer[start:end]
+    
+    def tell(self):
+        return self._position - self._offset
+    
+    def seek(self, position):
+        self._position = self._offset + position
+    
+    def close(self):
+        self._buffer = None
+    
+    def bytes_left(self):
+        return self._position < self._end
+    
+    def unpack(self, type, length):
+        """ Unpack directly from the buffer, without slicing it first."""
+        position = self._position
+        
+        assert position + length <= self._end, "Unexpected end of stream"
+        
+        if self._budget is not None:
+            self._budget.charge(length)
+        self._position = position + length
+        if self._endianess == endian.big:
+            return struct.unpack_from('>' + type, self._buffer, position)[0]
+        else:
+            return struct.unpack_from('<' + type, self._buffer, position)[0]
+    
+    def read_record(self, layout, obj):
+        """ Fill obj with the record described by layout, unpacked directly
+            from the buffer."""
+        position = self._position
+        
+        assert position + layout.size <= self._end, "Unexpected end of stream"
+        
+        if self._budget is not None:
+            self._budget.charge(layout.size)
+        self._position = position + layout.size
+        return layout.unpack_from(self._buffer, position, obj,
+                                  self._endianess)
+    
+    def read_subsegment(self, length):
+        """ Return a window on the next length bytes, the data is not
+            copied."""
+        start = self._position
+        if length < 0 or start + length > self._end or \
+           self._limits is not None:
+            length = self.check_element(length)
+        if self._budget is not None:
+            self._budget.charge(length)
+        self._position = start + length
+        stream = BufferStream(self._buffer, start, length, self._endianess)
+        return self._child(stream, start - self._offset)
+    
+    def read_window(self, length):
+        """ The data is already in memory, the window is a view on it."""
+        return self.read_subsegment(length)
+
+
+class WindowStream(BinaryStream):
+    """ Window (offset, length) on a parent stream which is read lazily, only
+        the data which is actually read is read from the parent. Seeking
+        past data, for example to skip a large atom, costs nothing. Windows
+        on a window refer to the same parent."""
+    
+    def __init__(self, parent, offset, length, endianess=endian.little):
+        BinaryStream.__init__(self, None, length, endianess, 0)
+        self.forward_only = parent.forward_only
+        self._parent = parent
+        self._offset = offset
+    
+    def read(self, length):
+        if not length:
+            return ''
+        
+        left = self._filesize - self._position
+        if length < 0 or length > left:
+            length = left
+        if length <= 0:
+            return ''
+        
+        data = self._parent.read_at(self._offset + self._position, length)
+        self._position += len(data)
+        return data
+    
+    def read_window(self, length):
+        start = self._position
+        if not 0 <= length <= self._filesize - start:
+            length = self.check_extent(length)
+        self._position = start + length
+        return self._child(WindowStream(self._parent, self._offset + start,
+                                        length, self._endianess), start)
+    
+    def close(self):
+        self._parent = None
+    
+    def detach(self):
+        self._parent = None
+
+
+class ViewStream(BufferStream):
+    """ BufferStream over a memoryview, reads return strings like the other
+        streams. Only the data which is read is copied."""
+    
+    def read(self, length):
+        data = BufferStream.read(self, length)
+        if data:
+            return data.tobytes()
+        return ''
+    
+    def read_subsegment(self, length):
+        start = self._position
+        if length < 0 or start + length > self._end or \
+           self._limits is not None:
+            length = self.check_element(length)
+        if self._budget is not None:
+            self._budget.charge(length)
+        self._position = start + length
+        stream = ViewStream(self._buffer, start, length, self._endianess)
+        return self._child(stream, start - self._offset)
+
+
+class ForwardStream(BinaryStream):
+    """ BinaryStream over a file object which can only be read forward, such
+        as a pipe or an upload. Seeking forward reads and discards the data
+        in between. Seeking back is possible into the last rewind bytes
+        before the position, further back raises an IOError. Reading to the
+        end, with a negative length, would keep the whole file in memory and
+        raises an IOError as well. The size is None when it's not known.
+        
+        While the size isn't known a corrupt element size can't be checked
+        against it, reads of more than max_element bytes raise a LimitError.
+        The max_element_size of the Limits replaces it when set. """
+    
+    forward_only = True
+    
+    def __init__(self, fileobj, size=None, endianess=endian.little,
+                 rewind=1048576, chunk=65536, max_element=67108864):
+        BinaryStream.__init__(self, fileobj, size, endianess, 0)
+        self._rewind = rewind
+        self._chunk = chunk
+        self._max_element = max_element
+        self._eof = False
+        
+        # The data kept from the file, starting at offset _data_start
+        self._data = ''
+        self._data_start = 0
+    
+    def _fill(self, end):
+        """ Read from the file object until the data up to offset end is
+            kept, or the end of the file is reached. """
+        data_end = self._data_start + len(self._data)
+        if end <= data_end or self._eof:
+            return
+        
+        # Drop the data which is more than rewind bytes behind
+        drop = min(self._position - self._rewind - self._data_start,
+                   len(self._data))
+        if drop > 0:
+            self._data = self._data[drop:]
+            self._data_start += drop
+        
+        # Read at most rewind bytes at once, the end may be a corrupt size
+        chunks = [self._data]
+        while data_end < end:
+            data = self._fileobj.read(max(min(end - data_end, self._rewind),
+                                          self._chunk))
+            self.read_calls += 1
+            if not data:
+                self._eof = True
+                break
+            self.bytes_read += len(data)
+            if self._stats is not None:
+                self._stats.read_calls += 1
+                self._stats.bytes_read += len(data)
+            chunks.append(data)
+            data_end += len(data)
+        self._data = ''.join(chunks)
+    
+    def _discard(self, length):
+        """ Read and drop length bytes after the kept data, they count to
+            the byte budget like the data which is kept. """
+        while length > 0:
+            data = self._fileobj.read(min(length, self._chunk))
+            self.read_calls += 1
+            if not data:
+                self._eof = True
+                break
+            self.bytes_read += len(data)
+            if self._budget is not None:
+                self._budget.charge(len(data))
+            if self._stats is not None:
+                self._stats.read_calls += 1
+                self._stats.bytes_read += len(data)
+            self._data_start += len(data)
+            length -= len(data)
+    
+    def read(self, length):
+        if not length:
+            return ''
+        if length < 0:
+            raise IOError("Can't read to the end of a forward only stream")
+        if length > self._max_element and self.get_size() is None:
+            raise LimitError("Element of %d bytes at offset %d exceeds the "
+                             "maximum element size of %d bytes of a stream "
+                             "of unknown size" %
+                             (length, self._position, self._max_element))
+        
+        self._fill(self._position + length)
+        start = self._position - self._data_start
+        data = self._data[start:start + length]
+        if self._budget is not None:
+            self._budget.charge(len(data))
+        self._position += len(data)
+        return data
+    
+    def seek(self, position):
+        if position < self._data_start:
+            raise IOError("Can't seek back to %d in a forward only stream" %
+                          position)
+        
+        data_end = self._data_start + len(self._data)
+        if position > data_end:
+            if self._stats is not None:
+                self._stats.seeks += 1
+                self._stats.seek_distance += position - data_end
+            self._data_start = data_end
+            self._data = ''
+            self._discard(position - data_end)
+        self._position = position
+    
+    def read_window(self, length):
+        """ Data behind the rewind limit is lost, so the window is read
+            immediately."""
+        return self.read_subsegment(length)
+    
+    def set_limits(self, limits):
+        BinaryStream.set_limits(self, limits)
+        if limits.max_element_size is not None:
+            self._max_element = limits.max_element_size
+    
+    def get_size(self):
+        """ The size of the file once its end has been read. """
+        if self._filesize is None and self._eof:
+            return self._data_start + len(self._data)
+        return self._filesize
+    
+    def bytes_left(self):
+        self._fill(self._position + 1)
+        return self._position < self._data_start + len(self._data)
+    
+    def close(self):
+        self._data = ''
+        BinaryStream.close(self)
+    
+    def detach(self):
+        self._data = ''
+        return BinaryStream.detach(self)
+
+
+class MappedStream(BufferStream):
+    """ BufferStream over a memory mapped file. Field reads are slices of the
+        mapping and seeks only move the position, the file and the mapping
+        are released by close()."""
+    
+    def __init__(self, mapping, fileobj, endianess=endian.little):
+        BufferStream.__init__(self, mapping, 0, len(mapping), endianess)
+        self._fileobj = fileobj
+    
+    def close(self):
+        if self._buffer is not None:
+            self._buffer.close()
+            self._buffer = None
+        self._fileobj.close()
@@ -0,0 +1,164 @@
+""" Reader for EBML elements, the container format used by Matroska.
+
+    See http://www.matroska.org/technical/specs/index.html
+"""
+
+#
+#  Copyright (c) 2007 Michael van Tellingen <michaelvantellingen@gmail.com>
+#  All rights reserved.
+#
+#  Redistribution and use in source and binary forms, with or without
+#  modification, are permitted provided that the following conditions
+#  are met:
+#  1. Redistributions of source code must retain the above copyright
+#     notice, this list of conditions and the following disclaimer.
+#  2. The name of the author may not be used to endorse or promote products
+#     derived from this software without specific prior written permission
+#
+#  THIS SOFTWARE IS PROVIDED BY THE AUTHOR ``AS IS'' AND ANY EXPRESS OR
+#  IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED WARRANTIES
+#  OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE DISCLAIMED.
+#  IN NO EVENT SHALL THE AUTHOR BE LIABLE FOR ANY DIRECT, INDIRECT,
+#  INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT
+#  NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE,
+#  DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY
+#  THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+#  (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF
+#  THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+#
+
+import binascii
+import struct
+
+
+__all__ = ['Reader']
+
+
+# Length in bytes of a variable length integer, indexed by its first byte.
+# The length is the number of leading zero bits + 1, 0 marks an invalid byte
+vint_length = [0] + [9 - len(bin(octet)[2:]) for octet in range(1, 256)]
+
+_hexlify = binascii.hexlify
+_float = {
+    4:  struct.Struct('>f'),
+    8:  struct.Struct('>d'),
+}
+
+
+class Reader(object):
+    """ Reads EBML elements from a stream through a window of window bytes,
+        so element ids and sizes are decoded from memory instead of with
+        separate reads on the stream."""
+
+    def __init__(self, stream, window=65536):
+        self._stream = stream
+        self._window = window
+        self._buffer = ''
+        self._offset = 0
+        self._base = stream.tell()
+
+    def _fill(self, length):
+        """ Make sure that at least length bytes are available in the window
+            (less at the end of the stream)."""
+        available = len(self._buffer) - self._offset
+        if available >= length:
+            return
+
+        data = self._stream.read(max(self._window, length - available))
+        self._base += self._offset
+        self._buffer = self._buffer[self._offset:] + data
+        self._offset = 0
+
+    def tell(self):
+        return self._base + self._offset
+
+    def bytes_left(self):
+        return self._offset < len(self._buffer) or self._stream.bytes_left()
+
+    def read_element_header(self):
+        """ Read the id and size of the next element, the size is None when
+            the element has an unknown size."""
+        if len(self._buffer) - self._offset < 12:
+            self._fill(12)
+        buffer = self._buffer
+        position = self._offset
+
+        assert position < len(buffer), "Unexpected end of stream"
+
+        octet = ord(buffer[position])
+        id_length = vint_length[octet]
+        if id_length == 1:
+            class_id = octet
+        elif 1 < id_length <= 4:
+            class_id = int(_hexlify(buffer[position:position + id_length]), 16)
+        else:
+            raise AssertionError("Invalid element id at offset %d" %
+                                 self.tell())
+
+        position += id_length
+        octet = ord(buffer[position:position + 1] or '\x00')
+        size_length = vint_length[octet]
+        end = position + size_length
+        if not size_length or end > len(buffer):
+            raise AssertionError("Invalid element size at offset %d" %
+                                 self.tell())
+
+        # Remove the length marker from the size, all value bits set means
+        # that the size is unknown
+        if size_length == 1:
+            size = octet & 0x7f
+            mask = 0x7f
+        else:
+            mask = (1 << (7 * size_length)) - 1
+            size = int(_hexlify(buffer[position:end]), 16) & mask
+        if size == mask:
+            size = None
+
+        self._offset = end
+        return class_id, size
+
+    def read(self, length):
+        # The size of the element is checked before it's read into memory
+        available = len(self._buffer) - self._offset
+        if length > available:
+            self._stream.check_element(length - available)
+
+        self._fill(length)
+        data = self._buffer[self._offset:self._offset + length]
+        self._offset += len(data)
+
+        assert len(data) == length, "Unexpected end of stream"
+
+        return data
+
+    def read_unsigned(self, length):
+        if not length:
+            return 0
+        return int(_hexlify(self.read(length)), 16)
+
+    def read_float(self, length):
+        if not length:
+            return 0.0
+
+        try:
+            format = _float[length]
+        except KeyError:
+            raise AssertionError("Unsupported float size %d" % length)
+        return format.unpack(self.read(length))[0]
+
+    def read_string(self, length):
+        """ Read an ASCII or UTF-8 string, which may be padded with zero
+            bytes."""
+        return self.read(length).rstrip('\x00')
+
+    def skip(self, length):
+        """ Skip over length bytes, without reading them when they are not in
+            the window."""
+        if self._offset + length <= len(self._buffer):
+            self._offset += length
+            return
+
+        self._base = self.tell() + length
+        self._buffer = ''
+        self._offset = 0
+        self._stream.seek(self._base)
@@ -24,20 +24,77 @@
 
 import os
 import stat
+import mmap
 
-from videoparser.streams.binary import BinaryStream
+from videoparser.streams.binary import BinaryStream, BufferStream, \
+                                       ForwardStream, MappedStream, ViewStream
 
-def create_filestream(filename, endianess):
+# Memory map files by default instead of reading them through the file object
+use_mmap = False
+
+# Size of the read-ahead window of file streams, 0 disables it
+read_ahead = 65536
+
+def create_filestream(filename, endianess, mapped=None, window=None):
+    """ Open filename and return a stream on it. When mapped is True (or
+        None and use_mmap is set) the file is memory mapped, files which can't
+        be mapped fall back to a normal file stream. window overrides the
+        read_ahead size of the file stream. """
     filesize = os.stat(filename)[stat.ST_SIZE]
     
     if filesize == 0:
         raise IOError("File %s is 0 bytes!" % filename)
-    fh = open(filename, 'rb')
-    stream = BinaryStream(fh, filesize, endianess)
+    
+    # The stream does its own buffering
+    fh = open(filename, 'rb', 0)
+    
+    if mapped is None:
+        mapped = use_mmap
+    
+    if mapped:
+        try:
+            mapping = mmap.mmap(fh.fileno(), filesize, access=mmap.ACCESS_READ)
+        except (EnvironmentError, ValueError, OverflowError):
+            pass
+        else:
+            return MappedStream(mapping, fh, endianess)
+    
+    if window is None:
+        window = read_ahead
+    
+    stream = BinaryStream(fh, filesize, endianess, window)
     return stream
 
 
 def create_stringstream(data, endianess):
-    fh = cStringIO.StringIO(data)
-    stream = BinaryStream(fh, len(data), endianess)
-    return stream
\ No newline at end of file
+    """ Return a stream on data, a string, a memoryview or an object
+        supporting the buffer interface such as a bytearray or mmap. The data
+        is not copied. """
+    if isinstance(data, memoryview):
+        return ViewStream(data, 0, len(data), endianess)
+    
+    # Slices of a buffer object are strings
+    if not isinstance(data, str):
+        data = buffer(data)
+    return BufferStream(data, 0, len(data), endianess)
+
+
+def create_fileobjstream(fileobj, endianess, size=None, window=None):
+    """ Return a stream on a seekable file object, the file is parsed from
+        the start. size is the size of the file, when it's not given the
+        file object is seeked to the end to find it. """
+    if size is None:
+        fileobj.seek(0, os.SEEK_END)
+        size = fileobj.tell()
+    fileobj.seek(0)
+    
+    if window is None:
+        window = read_ahead
+    
+    return BinaryStream(fileobj, size, endianess, window)
+
+
+def create_forwardstream(fileobj, endianess, size=None):
+    """ Return a stream on a file object which can't seek, such as a pipe.
+        The file is parsed from its current position. """
+    return ForwardStream(fileobj, size, endianess)
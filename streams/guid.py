@@ -0,0 +1,49 @@
+""" GUID conversion between the raw 16 byte form and the string form. """
+
+#
+#  Copyright (c) 2007 Michael van Tellingen <michaelvantellingen@gmail.com>
+#  All rights reserved.
+#
+#  Redistribution and use in source and binary forms, with or without
+#  modification, are permitted provided that the following conditions
+#  are met:
+#  1. Redistributions of source code must retain the above copyright
+#     notice, this list of conditions and the following disclaimer.
+#  2. The name of the author may not be used to endorse or promote products
+#     derived from this software without specific prior written permission
+#
+#  THIS SOFTWARE IS PROVIDED BY THE AUTHOR ``AS IS'' AND ANY EXPRESS OR
+#  IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED WARRANTIES
+#  OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE DISCLAIMED.
+#  IN NO EVENT SHALL THE AUTHOR BE LIABLE FOR ANY DIRECT, INDIRECT,
+#  INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT
+#  NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE,
+#  DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY
+#  THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+#  (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF
+#  THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+#
+
+import binascii
+import struct
+
+
+__all__ = ['to_string', 'to_bytes']
+
+
+# Data1 to Data3 are stored little endian, Data4 is a byte string
+_fields = struct.Struct('<IHH2s6s')
+
+def to_string(data):
+    """ Format a raw 16 byte GUID as 'XXXXXXXX-XXXX-XXXX-XXXX-XXXXXXXXXXXX'."""
+    data1, data2, data3, seq, node = _fields.unpack(data)
+    return "%08X-%04X-%04X-%s-%s" % (data1, data2, data3,
+                                     binascii.hexlify(seq).upper(),
+                                     binascii.hexlify(node).upper())
+
+def to_bytes(string):
+    """ Convert the string form of a GUID to the raw 16 bytes as stored in
+        the file, used to build lookup tables keyed by raw GUIDs."""
+    data1, data2, data3, seq, node = string.split('-')
+    return _fields.pack(int(data1, 16), int(data2, 16), int(data3, 16),
+                        binascii.unhexlify(seq), binascii.unhexlify(node))
@@ -0,0 +1,114 @@
+""" Declarative layouts for fixed size binary records. """
+
+#
+#  Copyright (c) 2007 Michael van Tellingen <michaelvantellingen@gmail.com>
+#  All rights reserved.
+#
+#  Redistribution and use in source and binary forms, with or without
+#  modification, are permitted provided that the following conditions
+#  are met:
+#  1. Redistributions of source code must retain the above copyright
+#     notice, this list of conditions and the following disclaimer.
+#  2. The name of the author may not be used to endorse or promote products
+#     derived from this software without specific prior written permission
+#
+#  THIS SOFTWARE IS PROVIDED BY THE AUTHOR ``AS IS'' AND ANY EXPRESS OR
+#  IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED WARRANTIES
+#  OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE DISCLAIMED.
+#  IN NO EVENT SHALL THE AUTHOR BE LIABLE FOR ANY DIRECT, INDIRECT,
+#  INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT
+#  NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE,
+#  DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY
+#  THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+#  (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF
+#  THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+#
+
+import datetime
+import struct
+
+from videoparser.streams import endian
+
+
+__all__ = ['Layout', 'mac_timestamp', 'win_timestamp', 'win_duration',
+           'qt_fixed']
+
+
+class Layout(object):
+    """ Layout of a fixed size record, compiled once into a struct.Struct per
+        endianess.
+
+        The fields are (name, format) or (name, format, convert) tuples, where
+        format is a struct format code producing exactly one value and
+        convert an optional function applied to that value. Padding is
+        specified with a name of None and an 'x' format.
+
+        Example:
+            header = Layout([
+                ('type',        '4s'),
+                (None,          '2x'),
+                ('timescale',   'I'),
+                ('width',       'i', qt_fixed),
+            ])
+            stream.read_record(header, obj)"""
+
+    def __init__(self, fields):
+        format = ''
+        self.names = []
+        self._converters = []
+
+        for field in fields:
+            name, code = field[0], field[1]
+            format += code
+            if name is None:
+                continue
+
+            if len(field) > 2:
+                self._converters.append((len(self.names), field[2]))
+            self.names.append(name)
+
+        self._structs = {
+            endian.little:  struct.Struct('<' + format),
+            endian.big:     struct.Struct('>' + format),
+        }
+        self.size = self._structs[endian.little].size
+
+        values = self._structs[endian.little].unpack('\x00' * self.size)
+        if len(values) != len(self.names):
+            raise ValueError("Every named field should produce one value")
+
+    def unpack_from(self, buffer, offset, obj, endianess):
+        """ Unpack the record at offset in buffer and set the fields as
+            attributes on obj. Returns obj."""
+        values = self._structs[endianess].unpack_from(buffer, offset)
+
+        if self._converters:
+            values = list(values)
+            for index, convert in self._converters:
+                values[index] = convert(values[index])
+
+        for name, value in zip(self.names, values):
+            setattr(obj, name, value)
+        return obj
+
+
+# Converters for commonly used field types
+
+_mac_epoch = datetime.datetime(1904, 1, 1, 0, 0)
+_win_epoch = datetime.datetime(1601, 1, 1, 0, 0, 0)
+
+def mac_timestamp(value):
+    """ Seconds since 1904 (format 'I') to a datetime. """
+    return _mac_epoch + datetime.timedelta(seconds=value)
+
+def win_timestamp(value):
+    """ 100ns units since 1601 (format 'Q') to a datetime. """
+    return _win_epoch + datetime.timedelta(microseconds=value / 10)
+
+def win_duration(value):
+    """ 100ns units (format 'Q') to a timedelta. """
+    return datetime.timedelta(microseconds=value / 10)
+
+def qt_fixed(value):
+    """ QuickTime 16.16 fixed point number (format 'i' or 'I') to a float. """
+    return (value >> 16) + float(value & 0xffff) / 65535
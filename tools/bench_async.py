@@ -0,0 +1,120 @@
+""" Benchmark of parse_file_async and parse_files against parsing serially,
+    on fixtures read with an injected latency per read to simulate a network
+    mount:
+
+        python tools/bench_async.py --latency 10 --files 200
+"""
+#
+#  Copyright (c) 2007 Michael van Tellingen <michaelvantellingen@gmail.com>
+#  All rights reserved.
+#
+#  Redistribution and use in source and binary forms, with or without
+#  modification, are permitted provided that the following conditions
+#  are met:
+#  1. Redistributions of source code must retain the above copyright
+#     notice, this list of conditions and the following disclaimer.
+#  2. The name of the author may not be used to endorse or promote products
+#     derived from this software without specific prior written permission
+#
+#  THIS SOFTWARE IS PROVIDED BY THE AUTHOR ``AS IS'' AND ANY EXPRESS OR
+#  IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED WARRANTIES
+#  OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE DISCLAIMED.
+#  IN NO EVENT SHALL THE AUTHOR BE LIABLE FOR ANY DIRECT, INDIRECT,
+#  INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT
+#  NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE,
+#  DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY
+#  THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+#  (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF
+#  THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+#
+
+# Python built-in modules
+import optparse
+import shutil
+import sys
+import tempfile
+import time
+
+# Project modules
+import videoparser
+import videoparser.streams.factory
+
+import fixtures
+
+
+class SlowFile(object):
+    """ File object which sleeps latency seconds before every read, like a
+        file on a network mount."""
+    
+    def __init__(self, fileobj, latency):
+        self._fileobj = fileobj
+        self._latency = latency
+    
+    def read(self, *args):
+        time.sleep(self._latency)
+        return self._fileobj.read(*args)
+    
+    def __getattr__(self, name):
+        return getattr(self._fileobj, name)
+
+def inject_latency(latency):
+    """ Make the file streams of videoparser open SlowFiles. """
+    def slow_open(*args):
+        return SlowFile(open(*args), latency)
+    videoparser.streams.factory.open = slow_open
+
+def timed(function, *args):
+    start = time.time()
+    result = function(*args)
+    return time.time() - start, result
+
+
+def serial(parser, filenames):
+    return [parser._parse_one(filename) for filename in filenames]
+
+def parse_async(parser, filenames):
+    results = [parser.parse_file_async(filename) for filename in filenames]
+    return [result.get() for result in results]
+
+def parse_files(parser, filenames, workers):
+    results = dict(parser.parse_files(filenames, workers, mode='thread'))
+    return [(filename, results[filename]) for filename in filenames]
+
+
+def main(argv=None):
+    option_parser = optparse.OptionParser(usage="%prog [options]")
+    option_parser.add_option("-l", "--latency", type="float", default=10.0,
+                             help="milliseconds per read (default 10)")
+    option_parser.add_option("-n", "--files", type="int", default=200)
+    option_parser.add_option("-j", "--workers", type="int", default=16,
+                             help="workers of parse_files (default 16)")
+    options, args = option_parser.parse_args(argv)
+    
+    directory = tempfile.mkdtemp()
+    try:
+        names = fixtures.write_fixtures(directory)
+        names = [name for name in names if not name.endswith('big.mov')]
+        filenames = (names * options.files)[:options.files]
+        
+        inject_latency(options.latency / 1000.0)
+        parser = videoparser.VideoParser()
+        serial_time, expected = timed(serial, parser, filenames)
+        async_time, async_results = timed(parse_async, parser, filenames)
+        files_time, files_results = timed(parse_files, parser, filenames,
+                                          options.workers)
+    finally:
+        shutil.rmtree(directory)
+    
+    expected = map(repr, expected)
+    print "%d files, %.0f ms per read" % (len(filenames), options.latency)
+    print "serial                         %.2f s" % serial_time
+    print "parse_file_async (%2d threads)  %.2f s, same results: %s" % (
+        videoparser.async_workers, async_time,
+        map(repr, async_results) == expected)
+    print "parse_files thread (%2d)        %.2f s, same results: %s" % (
+        options.workers, files_time, map(repr, files_results) == expected)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
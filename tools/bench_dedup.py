@@ -0,0 +1,104 @@
+""" Benchmark of the dedup cache on copies of the QuickTime fixtures with a
+    big moov atom, huge.mov with a sample size table of 150 MiB and big.mov
+    with a large time-to-sample table. The fingerprint of a copy should read
+    about as much as a parse, not the whole moov atom:
+
+        python tools/bench_dedup.py --copies 20 --byte-budget 8388608
+"""
+#
+#  Copyright (c) 2007 Michael van Tellingen <michaelvantellingen@gmail.com>
+#  All rights reserved.
+#
+#  Redistribution and use in source and binary forms, with or without
+#  modification, are permitted provided that the following conditions
+#  are met:
+#  1. Redistributions of source code must retain the above copyright
+#     notice, this list of conditions and the following disclaimer.
+#  2. The name of the author may not be used to endorse or promote products
+#     derived from this software without specific prior written permission
+#
+#  THIS SOFTWARE IS PROVIDED BY THE AUTHOR ``AS IS'' AND ANY EXPRESS OR
+#  IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED WARRANTIES
+#  OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE DISCLAIMED.
+#  IN NO EVENT SHALL THE AUTHOR BE LIABLE FOR ANY DIRECT, INDIRECT,
+#  INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT
+#  NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE,
+#  DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY
+#  THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+#  (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF
+#  THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+#
+# Python built-in modules
+import optparse
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+# Project modules
+import videoparser
+import videoparser.cache
+
+import fixtures
+
+
+def copies(directory, count):
+    """ Write the big moov fixtures and count links to each, the dedup
+        cache recognises the links as copies. """
+    paths = [path for path in fixtures.write_fixtures(directory, huge=True)
+             if os.path.basename(path) in ('big.mov', 'huge.mov')]
+    filenames = []
+    for path in paths:
+        for i in range(count):
+            filename = '%s.%d.mov' % (path, i)
+            os.link(path, filename)
+            filenames.append(filename)
+    return filenames
+
+def run(filenames, dedup, byte_budget, workers):
+    """ Parse filenames and return the time taken, the results ordered
+        like filenames and the number of bytes read."""
+    parser = videoparser.VideoParser(dedup=dedup, byte_budget=byte_budget,
+                                     stats=True)
+    start = time.time()
+    results = dict(parser.parse_files(filenames, workers, mode='thread'))
+    elapsed = time.time() - start
+    
+    results = [results[filename] for filename in filenames]
+    bytes_read = sum(result.stats.bytes_read for result in results
+                     if isinstance(result, videoparser.videofile.VideoFile))
+    return elapsed, results, bytes_read
+
+
+def main(argv=None):
+    option_parser = optparse.OptionParser(usage="%prog [options]")
+    option_parser.add_option("-n", "--copies", type="int", default=20,
+                             help="copies of each fixture (default 20)")
+    option_parser.add_option("-b", "--byte-budget", type="int",
+                             help="byte budget of each parse")
+    option_parser.add_option("-j", "--workers", type="int", default=4)
+    options, args = option_parser.parse_args(argv)
+    
+    directory = tempfile.mkdtemp()
+    try:
+        filenames = copies(directory, options.copies)
+        plain_time, expected, plain_read = run(
+            filenames, None, options.byte_budget, options.workers)
+        dedup = videoparser.cache.DedupCache()
+        dedup_time, results, dedup_read = run(
+            filenames, dedup, options.byte_budget, options.workers)
+    finally:
+        shutil.rmtree(directory)
+    
+    print "%d files, byte budget %s" % (len(filenames), options.byte_budget)
+    print "without dedup  %.2f s, %d bytes read" % (plain_time, plain_read)
+    print "with dedup     %.2f s, %d bytes read, %d bytes hashed, %d hits, " \
+          "same results: %s" % (dedup_time, dedup_read, dedup.bytes_hashed,
+                                dedup.hits,
+                                map(repr, results) == map(repr, expected))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,100 @@
+""" Benchmark of the Matroska parser on a file with tens of thousands of
+    elements. Compare revisions by running it with a checkout of each on the
+    PYTHONPATH:
+
+        PYTHONPATH=/path/to/checkout python tools/bench_ebml.py
+"""
+#
+#  Copyright (c) 2007 Michael van Tellingen <michaelvantellingen@gmail.com>
+#  All rights reserved.
+#
+#  Redistribution and use in source and binary forms, with or without
+#  modification, are permitted provided that the following conditions
+#  are met:
+#  1. Redistributions of source code must retain the above copyright
+#     notice, this list of conditions and the following disclaimer.
+#  2. The name of the author may not be used to endorse or promote products
+#     derived from this software without specific prior written permission
+#
+#  THIS SOFTWARE IS PROVIDED BY THE AUTHOR ``AS IS'' AND ANY EXPRESS OR
+#  IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED WARRANTIES
+#  OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE DISCLAIMED.
+#  IN NO EVENT SHALL THE AUTHOR BE LIABLE FOR ANY DIRECT, INDIRECT,
+#  INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT
+#  NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE,
+#  DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY
+#  THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+#  (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF
+#  THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+#
+
+# Python built-in modules
+import optparse
+import os
+import shutil
+import struct
+import sys
+import tempfile
+import time
+
+# Project modules
+import videoparser
+
+import fixtures
+
+
+def many_elements(voids, tracks):
+    """ A Matroska file with voids Void elements and tracks track entries,
+        in a segment with an unknown size."""
+    def element(id, body):
+        # Sizes in 2 bytes, like most muxers write them
+        return id + struct.pack('>H', 0x4000 | len(body)) + body
+    
+    # Subtitle tracks, nothing is extracted from them
+    track = element('\xae', element('\xd7', '\x01') + element('\x83', '\x11') +
+                    element('\x86', 'V_X') +
+                    element('\x23\x31\x4f', struct.pack('>f', 1.0)))
+    tracks = track * tracks
+    body = (element('\xec', 'xx') * voids + '\x16\x54\xae\x6b' +
+            struct.pack('>Q', len(tracks) | (1 << 56)) + tracks)
+    return (fixtures.element('\x1a\x45\xdf\xa3',
+                             fixtures.element('\x42\x82', 'matroska')) +
+            '\x18\x53\x80\x67' + '\x01\xff\xff\xff\xff\xff\xff\xff' + body)
+
+def bench(filename, repeat):
+    """ Return the best time of repeat parses of filename. """
+    parser = videoparser.VideoParser()
+    best = None
+    for i in range(repeat):
+        start = time.time()
+        if parser.parse_file(filename) is None:
+            raise AssertionError("%s was not parsed" % filename)
+        elapsed = time.time() - start
+        if best is None or elapsed < best:
+            best = elapsed
+    return best
+
+
+def main(argv=None):
+    option_parser = optparse.OptionParser(usage="%prog [options]")
+    option_parser.add_option("--voids", type="int", default=20000)
+    option_parser.add_option("--tracks", type="int", default=2000)
+    option_parser.add_option("-r", "--repeat", type="int", default=5)
+    options, args = option_parser.parse_args(argv)
+    
+    directory = tempfile.mkdtemp()
+    try:
+        filename = os.path.join(directory, 'many.mkv')
+        open(filename, 'wb').write(many_elements(options.voids,
+                                                 options.tracks))
+        elapsed = bench(filename, options.repeat)
+    finally:
+        shutil.rmtree(directory)
+    
+    print "%d elements: %.1f ms per parse" % (
+        options.voids + options.tracks * 5, elapsed * 1000)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,91 @@
+""" Cold start benchmark: the time to import videoparser, create a
+    VideoParser and parse a first .mov file, each sample in a new interpreter.
+    Compare revisions by running it with a checkout of each on the
+    PYTHONPATH:
+
+        PYTHONPATH=/path/to/checkout python tools/bench_import.py
+"""
+#
+#  Copyright (c) 2007 Michael van Tellingen <michaelvantellingen@gmail.com>
+#  All rights reserved.
+#
+#  Redistribution and use in source and binary forms, with or without
+#  modification, are permitted provided that the following conditions
+#  are met:
+#  1. Redistributions of source code must retain the above copyright
+#     notice, this list of conditions and the following disclaimer.
+#  2. The name of the author may not be used to endorse or promote products
+#     derived from this software without specific prior written permission
+#
+#  THIS SOFTWARE IS PROVIDED BY THE AUTHOR ``AS IS'' AND ANY EXPRESS OR
+#  IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED WARRANTIES
+#  OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE DISCLAIMED.
+#  IN NO EVENT SHALL THE AUTHOR BE LIABLE FOR ANY DIRECT, INDIRECT,
+#  INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT
+#  NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE,
+#  DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY
+#  THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+#  (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF
+#  THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+#
+
+# Python built-in modules
+import json
+import optparse
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+
+import fixtures
+
+# Run in a new interpreter for every sample, the times are printed as JSON
+probe = """
+import json, sys, time
+start = time.time()
+import videoparser
+imported = time.time()
+parser = videoparser.VideoParser()
+created = time.time()
+parser.parse_file(sys.argv[1])
+parsed = time.time()
+print json.dumps({
+    'import': imported - start,
+    'VideoParser()': created - imported,
+    'first parse': parsed - created,
+    'plugins': sorted(name for name in sys.modules
+                      if name.startswith('videoparser.plugins.') and
+                         sys.modules[name] is not None),
+})
+"""
+
+def sample(filename):
+    """ Return the times of one cold start which parses filename. """
+    output = subprocess.check_output([sys.executable, '-c', probe, filename])
+    return json.loads(output.splitlines()[-1])
+
+
+def main(argv=None):
+    option_parser = optparse.OptionParser(usage="%prog [options]")
+    option_parser.add_option("-r", "--repeat", type="int", default=10)
+    options, args = option_parser.parse_args(argv)
+    
+    directory = tempfile.mkdtemp()
+    try:
+        filename = os.path.join(directory, 'a.mov')
+        open(filename, 'wb').write(fixtures.mov())
+        samples = [sample(filename) for i in range(options.repeat)]
+    finally:
+        shutil.rmtree(directory)
+    
+    for step in ['import', 'VideoParser()', 'first parse']:
+        times = sorted(result[step] * 1000 for result in samples)
+        print "%-14s min %6.2f ms  median %6.2f ms" % (
+            step, times[0], times[len(times) // 2])
+    print "plugins loaded: %s" % ", ".join(samples[-1]['plugins'])
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
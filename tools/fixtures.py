@@ -0,0 +1,278 @@
+""" Generator of small synthetic files in every supported format, used by the
+    stress test and the benchmarks."""
+#
+#  Copyright (c) 2007 Michael van Tellingen <michaelvantellingen@gmail.com>
+#  All rights reserved.
+#
+#  Redistribution and use in source and binary forms, with or without
+#  modification, are permitted provided that the following conditions
+#  are met:
+#  1. Redistributions of source code must retain the above copyright
+#     notice, this list of conditions and the following disclaimer.
+#  2. The name of the author may not be used to endorse or promote products
+#     derived from this software without specific prior written permission
+#
+#  THIS SOFTWARE IS PROVIDED BY THE AUTHOR ``AS IS'' AND ANY EXPRESS OR
+#  IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED WARRANTIES
+#  OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE DISCLAIMED.
+#  IN NO EVENT SHALL THE AUTHOR BE LIABLE FOR ANY DIRECT, INDIRECT,
+#  INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT
+#  NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE,
+#  DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY
+#  THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+#  (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF
+#  THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+#
+
+# Python built-in modules
+import os
+import struct
+import sys
+import uuid
+
+
+__all__ = ['mov', 'avi', 'mkv', 'rm', 'asf', 'write_fixtures']
+
+
+def atom(type, body):
+    return struct.pack('>I', 8 + len(body)) + type + body
+
+def qtfixed(value):
+    return struct.pack('>hH', int(value), 0)
+
+def mov(stts_entries=3, stsz=12, faststart=True):
+    """ A QuickTime file with a 1920x1080 H.264 track and a 48 kHz audio
+        track. The video track has stts_entries time-to-sample entries and
+        a sample size table of stsz bytes. The moov atom is after the
+        mdat atom when faststart is False."""
+    ftyp = atom('ftyp', 'qt  ' + struct.pack('>I', 0x200) + 'qt  ')
+    mvhd = atom('mvhd', '\x00' * 4 + struct.pack('>IIII', 0, 0, 600, 6000) +
+                struct.pack('>IH', 0x10000, 0x100) + '\x00' * 46 +
+                struct.pack('>7I', 0, 0, 0, 0, 0, 0, 3))
+    
+    def tkhd(track_id):
+        return atom('tkhd', '\x00\x00\x00\x0f' +
+                    struct.pack('>III', 0, 0, track_id) + '\x00' * 4 +
+                    struct.pack('>I', 6000) + '\x00' * 16 + '\x00' * 36 +
+                    qtfixed(1920) + qtfixed(1080))
+    
+    def mdhd(timescale, duration):
+        return atom('mdhd', '\x00' * 4 +
+                    struct.pack('>IIII', 0, 0, timescale, duration) +
+                    'und\x00')
+    
+    def hdlr(subtype):
+        return atom('hdlr', '\x00' * 4 + 'mhlr' + subtype +
+                    struct.pack('>III', 0, 0, 0) + '\x0cHandlerName')
+    
+    def stts(entries):
+        return atom('stts', '\x00' * 4 + struct.pack('>I', len(entries)) +
+                    ''.join(struct.pack('>II', count, duration)
+                            for count, duration in entries))
+    
+    def stsd(entry):
+        entry = struct.pack('>I', 4 + len(entry)) + entry
+        return atom('stsd', '\x00' * 4 + struct.pack('>I', 1) + entry)
+    
+    video_entry = ('avc1' + '\x00' * 6 + struct.pack('>HHH', 1, 0, 0) +
+                   'appl' + struct.pack('>ii', 0, 512) +
+                   struct.pack('>hh', 1920, 1080) + qtfixed(72) +
+                   qtfixed(72) + struct.pack('>ih', 0, 1) +
+                   struct.pack('32p', 'H.264') + struct.pack('>Hh', 24, -1) +
+                   atom('fiel', '\x02\x09') +
+                   atom('pasp', struct.pack('>II', 1, 1)))
+    audio_entry = ('sowt' + '\x00' * 6 + struct.pack('>HHH', 1, 0, 0) +
+                   struct.pack('>IHHhH', 0, 2, 16, 0, 0) +
+                   struct.pack('>HH', 48000, 0))
+    
+    video_stbl = atom('stbl', stsd(video_entry) +
+                      stts([(1, 1001)] * stts_entries) +
+                      atom('stsz', '\x00' * stsz))
+    video_trak = atom('trak', tkhd(1) + atom('mdia',
+        mdhd(24000, 1001 * stts_entries) + hdlr('vide') +
+        atom('minf', atom('vmhd', '\x00' * 12) + video_stbl)))
+    
+    audio_stbl = atom('stbl', stsd(audio_entry) + stts([(48000, 1)]))
+    audio_trak = atom('trak', tkhd(2) + atom('mdia',
+        mdhd(48000, 48000) + hdlr('soun') +
+        atom('minf', atom('smhd', '\x00' * 8) + audio_stbl)))
+    
+    moov = atom('moov', mvhd + video_trak + audio_trak)
+    mdat = atom('mdat', '\x00' * 64)
+    if faststart:
+        return ftyp + moov + mdat
+    return ftyp + mdat + moov
+
+def avi():
+    """ An AVI file with a 640x480 XviD stream and a 44.1 kHz MP3
+        stream."""
+    def chunk(id, body):
+        return id + struct.pack('<I', len(body)) + body
+    
+    def list(type, body):
+        return 'LIST' + struct.pack('<I', len(body) + 4) + type + body
+    
+    avih = struct.pack('<14I', 41708, 0, 0, 0, 250, 0, 2, 0, 640, 480,
+                       0, 0, 0, 0)
+    video_strh = ('vids' + 'XVID' +
+                  struct.pack('<IHHIIIIIIII', 0, 0, 0, 0, 1001, 24000, 0,
+                              250, 0, 0, 0) +
+                  struct.pack('<4H', 0, 0, 640, 480))
+    video_strf = (struct.pack('<IiiHH', 40, 640, 480, 1, 24) + 'XVID' +
+                  struct.pack('<IiiII', 0, 0, 0, 0, 0))
+    audio_strh = ('auds' + '\x00' * 4 +
+                  struct.pack('<IHHIIIIIIII', 0, 0, 0, 0, 1, 44100, 0, 100,
+                              0, 0, 0) +
+                  struct.pack('<4H', 0, 0, 0, 0))
+    audio_strf = struct.pack('<HHIIHHH', 0x55, 2, 44100, 16000, 1, 16, 0)
+    
+    hdrl = list('hdrl', chunk('avih', avih) +
+                list('strl', chunk('strh', video_strh) +
+                             chunk('strf', video_strf)) +
+                list('strl', chunk('strh', audio_strh) +
+                             chunk('strf', audio_strf)) +
+                chunk('JUNK', '\x00' * 10))
+    movi = list('movi', chunk('00dc', '\x00' * 100))
+    body = 'AVI ' + hdrl + movi
+    return 'RIFF' + struct.pack('<I', len(body)) + body
+
+def element(id, body):
+    """ An EBML element, the size is always written in 8 bytes."""
+    return id + struct.pack('>Q', len(body) | (1 << 56)) + body
+
+def mkv(clusters=1, unknown=0):
+    """ A Matroska file with a 1280x720 AVC track and an AAC track, a Void
+        element and clusters clusters. unknown elements with an unknown id
+        are put before the tracks."""
+    ebml = element('\x1a\x45\xdf\xa3', element('\x42\x82', 'matroska') +
+                   element('\x42\x87', '\x02') + element('\x42\x85', '\x02'))
+    video = element('\xae',
+        element('\xd7', '\x01') + element('\x83', '\x01') +
+        element('\x23\xe3\x83', struct.pack('>I', 41708333)) +
+        element('\x23\x31\x4f', struct.pack('>f', 1.0)) +
+        element('\x86', 'V_MPEG4/ISO/AVC') +
+        element('\xe0', element('\xb0', struct.pack('>H', 1280)) +
+                        element('\xba', struct.pack('>H', 720))))
+    audio = element('\xae',
+        element('\xd7', '\x02') + element('\x83', '\x02') +
+        element('\x86', 'A_AAC') +
+        element('\xe1', element('\xb5', struct.pack('>f', 48000.0)) +
+                        element('\x9f', '\x02')))
+    info = element('\x15\x49\xa9\x66',
+                   element('\x2a\xd7\xb1', '\x0f\x42\x40'))
+    segment = (info + element('\x4a\xbc', 'xxxx') * unknown +
+               element('\x16\x54\xae\x6b', video + audio) +
+               element('\xec', '\x00' * 8) +
+               element('\x1f\x43\xb6\x75', '\x00' * 50) * clusters)
+    return ebml + element('\x18\x53\x80\x67', segment)
+
+def rm():
+    """ A RealMedia file with a 320x240 RV40 stream and a cook stream."""
+    def chunk(id, body):
+        return id + struct.pack('>I', len(body) + 8) + body
+    
+    def mdpr(number, name, mime, type_data):
+        return chunk('MDPR', struct.pack('>HH', 0, number) +
+                     struct.pack('>7I', 0, 0, 0, 0, 0, 0, 10000) +
+                     chr(len(name)) + name + chr(len(mime)) + mime +
+                     struct.pack('>I', len(type_data)) + type_data)
+    
+    rmf = chunk('.RMF', struct.pack('>HII', 0, 0, 4))
+    prop = chunk('PROP', struct.pack('>H', 0) +
+                 struct.pack('>9I', 0, 0, 0, 0, 0, 10000, 0, 0, 0) +
+                 struct.pack('>HH', 2, 0))
+    video = (struct.pack('>HH', 0, 34) + 'VIDO' + 'RV40' +
+             struct.pack('>HH', 320, 240) + '\x00' * 6 +
+             struct.pack('>hH', 25, 0) + '\x00' * 8)
+    audio = ('.ra\xfd' + struct.pack('>HH', 4, 0) + '.ra4' +
+             struct.pack('>IHIHI', 0, 4, 0, 0, 0) + '\x00' * 12 +
+             struct.pack('>HHHH', 0, 0, 0, 0) +
+             struct.pack('>HHHH', 44100, 0, 16, 2) + '\x04Int4' +
+             '\x04cook' + '\x00' * 3 + struct.pack('>I', 0))
+    return (rmf + prop +
+            mdpr(0, 'Video', 'video/x-pn-realvideo', video) +
+            mdpr(1, 'Audio', 'audio/x-pn-realaudio', audio) +
+            chunk('DATA', '\x00' * 30))
+
+def asf():
+    """ An ASF file with a 320x240 WMV3 stream and a WMA stream."""
+    def guid(text):
+        return uuid.UUID(text).bytes_le
+    
+    def obj(id, body):
+        return guid(id) + struct.pack('<Q', 24 + len(body)) + body
+    
+    def stream_properties(type, number, type_data):
+        return obj('B7DC0791-A9B7-11CF-8EE6-00C00C205365',
+                   guid(type) + guid('20FB5700-5B55-11CF-A8FD-00805F5C442B') +
+                   struct.pack('<QII', 0, len(type_data), 0) +
+                   struct.pack('<H', number) + '\x00' * 4 + type_data)
+    
+    file_properties = obj('8CABDCA1-A947-11CF-8EE4-00C00C205365',
+        guid('12345678-1234-1234-1234-123456789ABC') +
+        struct.pack('<6Q', 0, 0, 0, 100000000, 100000000, 0) +
+        struct.pack('<4I', 2, 0, 0, 0))
+    bitmapinfo = (struct.pack('<IiiHH', 40, 320, 240, 1, 24) + 'WMV3' +
+                  struct.pack('<IiiII', 0, 0, 0, 0, 0))
+    video = stream_properties('BC19EFC0-5B4D-11CF-A8FD-00805F5C442B', 1,
+                              struct.pack('<IIBH', 320, 240, 2, 40) +
+                              bitmapinfo)
+    audio = stream_properties('F8699E40-5B4D-11CF-A8FD-00805F5C442B', 2,
+                              struct.pack('<HHIIHHH', 0x161, 2, 44100,
+                                          16000, 1, 16, 0))
+    extended = obj('14E6A5CB-C672-4332-8399-A96952065B5A',
+                   struct.pack('<QQ7I', 0, 0, 0, 0, 0, 0, 0, 0, 0) +
+                   struct.pack('<IHHQHH', 0, 1, 0, 400000, 0, 0))
+    padding = obj('1806D474-CADF-4509-A4BA-9AABCB96AAE8', '\x00' * 8)
+    extension = obj('5FBF03B5-A92E-11CF-8EE3-00C00C205365',
+                    guid('ABD3D211-A9BA-11CF-8EE6-00C00C205365') +
+                    struct.pack('<HI', 6, len(extended + padding)) +
+                    extended + padding)
+    
+    objects = [file_properties, video, audio, extension]
+    body = struct.pack('<IBB', len(objects), 1, 2) + ''.join(objects)
+    header = obj('75B22630-668E-11CF-A6D9-00AA0062CE6C', body)
+    return header + '\x00' * 50
+
+# The fixtures written by write_fixtures, name and function
+fixtures = [
+    ('a.mov',       lambda: mov()),
+    ('moovend.mov', lambda: mov(faststart=False)),
+    ('big.mov',     lambda: mov(stts_entries=200000)),
+    ('a.avi',       avi),
+    ('a.mkv',       mkv),
+    ('unk.mkv',     lambda: mkv(unknown=5000)),
+    ('a.rm',        rm),
+    ('a.wmv',       asf),
+    ('noext',       lambda: mov()),
+    ('junk.txt',    lambda: 'hello world' * 100),
+]
+
+# Size of the sample size table of huge.mov
+huge_stsz = 150 * 1024 * 1024
+
+def write_fixtures(directory, huge=False):
+    """ Write the fixtures to directory and return their paths. With huge
+        huge.mov is written as well, a file with a moov atom of 150 MiB
+        which is almost entirely sample size table."""
+    if not os.path.isdir(directory):
+        os.makedirs(directory)
+    
+    paths = []
+    for name, create in fixtures:
+        path = os.path.join(directory, name)
+        open(path, 'wb').write(create())
+        paths.append(path)
+    
+    if huge:
+        path = os.path.join(directory, 'huge.mov')
+        open(path, 'wb').write(mov(stsz=huge_stsz))
+        paths.append(path)
+    return paths
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        sys.exit("usage: fixtures.py DIRECTORY [--huge]")
+    for path in write_fixtures(sys.argv[1], '--huge' in sys.argv[2:]):
+        print path
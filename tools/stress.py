@@ -0,0 +1,110 @@
+""" Stress test for sharing one VideoParser between threads. Threads parse
+    the fixtures concurrently and their results are compared to the results
+    of parsing the same files serially.
+
+    Run it with the directory containing the videoparser package on the
+    PYTHONPATH:
+
+        python tools/stress.py --threads 8 --iterations 150
+"""
+#
+#  Copyright (c) 2007 Michael van Tellingen <michaelvantellingen@gmail.com>
+#  All rights reserved.
+#
+#  Redistribution and use in source and binary forms, with or without
+#  modification, are permitted provided that the following conditions
+#  are met:
+#  1. Redistributions of source code must retain the above copyright
+#     notice, this list of conditions and the following disclaimer.
+#  2. The name of the author may not be used to endorse or promote products
+#     derived from this software without specific prior written permission
+#
+#  THIS SOFTWARE IS PROVIDED BY THE AUTHOR ``AS IS'' AND ANY EXPRESS OR
+#  IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED WARRANTIES
+#  OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE DISCLAIMED.
+#  IN NO EVENT SHALL THE AUTHOR BE LIABLE FOR ANY DIRECT, INDIRECT,
+#  INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT
+#  NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE,
+#  DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY
+#  THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+#  (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF
+#  THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+#
+
+# Python built-in modules
+import optparse
+import random
+import shutil
+import sys
+import tempfile
+import threading
+
+# Project modules
+import videoparser
+
+import fixtures
+
+
+def parse(parser, filename):
+    """ Return a comparable description of the result for filename. """
+    try:
+        return repr(parser.parse_file(filename))
+    except Exception, err:
+        return 'error: %r' % err
+
+def stress(filenames, threads, iterations, seed=0):
+    """ Parse random picks from filenames on threads threads sharing one
+        VideoParser and return the (filename, expected, result) tuples of
+        the results which differ from parsing the files serially."""
+    parser = videoparser.VideoParser()
+    expected = dict((filename, parse(parser, filename))
+                    for filename in filenames)
+    mismatches = []
+    
+    def work(seed):
+        picks = random.Random(seed)
+        for i in xrange(iterations):
+            filename = picks.choice(filenames)
+            result = parse(parser, filename)
+            if result != expected[filename]:
+                mismatches.append((filename, expected[filename], result))
+    
+    workers = [threading.Thread(target=work, args=(seed + i,))
+               for i in range(threads)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    return mismatches
+
+
+def main(argv=None):
+    option_parser = optparse.OptionParser(usage="%prog [options]")
+    option_parser.add_option("-t", "--threads", type="int", default=8)
+    option_parser.add_option("-n", "--iterations", type="int", default=150,
+                             help="files parsed by each thread")
+    option_parser.add_option("--seed", type="int", default=0)
+    options, args = option_parser.parse_args(argv)
+    
+    # Switch threads as often as possible, so the parses interleave
+    sys.setcheckinterval(1)
+    
+    directory = tempfile.mkdtemp()
+    try:
+        filenames = fixtures.write_fixtures(directory)
+        mismatches = stress(filenames, options.threads, options.iterations,
+                            options.seed)
+    finally:
+        shutil.rmtree(directory)
+    
+    print "%d threads, %d parses, %d mismatches" % (
+        options.threads, options.threads * options.iterations,
+        len(mismatches))
+    for filename, expected, result in mismatches[:5]:
+        print "%s:\n  serial:\n%s\n  concurrent:\n%s" % (
+            filename, expected, result)
+    return mismatches and 1 or 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,105 @@
+"""Tracing of the parsing, a span for each element of a file which is visited"""
+#
+#  Copyright (c) 2007 Michael van Tellingen <michaelvantellingen@gmail.com>
+#  All rights reserved.
+#
+#  Redistribution and use in source and binary forms, with or without
+#  modification, are permitted provided that the following conditions
+#  are met:
+#  1. Redistributions of source code must retain the above copyright
+#     notice, this list of conditions and the following disclaimer.
+#  2. The name of the author may not be used to endorse or promote products
+#     derived from this software without specific prior written permission
+#
+#  THIS SOFTWARE IS PROVIDED BY THE AUTHOR ``AS IS'' AND ANY EXPRESS OR
+#  IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED WARRANTIES
+#  OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE DISCLAIMED.
+#  IN NO EVENT SHALL THE AUTHOR BE LIABLE FOR ANY DIRECT, INDIRECT,
+#  INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT
+#  NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE,
+#  DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY
+#  THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+#  (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF
+#  THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+#
+
+# Python built-in modules
+import json
+import os
+import thread
+import time
+
+
+__all__ = ['Tracer']
+
+
+class Tracer(object):
+	""" Records a span for every element of a file the parsers visit, like
+		an atom, chunk or object, with its file offset, size, the handler
+		which parsed it and the time it took. The spans of the elements in
+		a container are nested in the span of the container. Every parser
+		which is tried for a file gets a span as well.
+		
+		A Tracer is given to a VideoParser and records all files it parses,
+		also in the 'thread' mode of parse_files. Worker processes don't
+		share it, so the 'process' mode isn't traced.
+		
+		The trace can be written as Chrome trace event JSON, which can be
+		opened in chrome://tracing or Perfetto.
+		
+		Example:
+			tracer = Tracer()
+			parser = VideoParser(tracer=tracer)
+			parser.parse_file("video.mov")
+			tracer.write_chrome(open("trace.json", "w"))"""
+	
+	def __init__(self):
+		self.spans = []
+		self._start = time.time()
+	
+	def begin(self, name, category, offset=None, size=None, handler=None,
+			  **args):
+		""" Start a span and return it, category is the plugin. Extra args
+			are added to the span as they are. """
+		args.update(offset=offset, size=size, handler=handler)
+		span = [name, category, time.time(), None, thread.get_ident(), args]
+		self.spans.append(span)
+		return span
+	
+	def end(self, span, **args):
+		""" End the span, extra args are added to it. """
+		span[3] = time.time()
+		if args:
+			span[5].update(args)
+	
+	def clear(self):
+		""" Remove the recorded spans. """
+		self.spans = []
+	
+	def to_chrome(self):
+		""" Return the spans as a dict in the Chrome trace event format, a
+			complete event for each span. Times are in microseconds from
+			the creation of the tracer. Spans which didn't end, because the
+			parser raised an error, have a duration of 0 and are marked
+			unfinished. """
+		pid = os.getpid()
+		events = []
+		for name, category, start, end, tid, args in self.spans:
+			if end is None:
+				end = start
+				args = dict(args, unfinished=True)
+			events.append({
+				'name':	name,
+				'cat':	category,
+				'ph':	'X',
+				'ts':	(start - self._start) * 1000000.0,
+				'dur':	(end - start) * 1000000.0,
+				'pid':	pid,
+				'tid':	tid,
+				'args':	args,
+			})
+		return {'traceEvents': events, 'displayTimeUnit': 'ms'}
+	
+	def write_chrome(self, fileobj):
+		""" Write the spans as Chrome trace event JSON to fileobj. """
+		json.dump(self.to_chrome(), fileobj, default=repr)
@@ -38,6 +38,9 @@ class VideoFile(object):
 	def __init__(self):
 		self._streams = {}
 		self._format = ''
+		self._parse_time = None
+		self._warnings = []
+		self._stats = None
 		
 	def _add_stream(self, stream, index=None):
 		if index is None:
@@ -49,6 +52,46 @@ class VideoFile(object):
 	
 	def set_container(self, format):
 		self._format = format
+	
+	def get_container(self):
+		return self._format
+	container = property(fget=get_container)
+	
+	def set_parse_time(self, seconds):
+		self._parse_time = seconds
+	
+	def get_parse_time(self):
+		""" Seconds it took to parse the file. """
+		return self._parse_time
+	parse_time = property(fget=get_parse_time)
+	
+	def add_warning(self, source, message, count=1, **details):
+		""" Record a problem found count times in the file by source, the
+			parser which found it. details are values of basic types
+			describing it, like the offset. A repeated message is counted
+			instead of added again. """
+		for warning in self._warnings:
+			if warning['source'] == source and warning['message'] == message:
+				warning['count'] += count
+				return
+		
+		self._warnings.append(dict(details, source=source, message=message,
+								   count=count))
+	
+	def get_warnings(self):
+		""" The problems found in the file, a list of dicts with the source,
+			message and count of each problem and its details. """
+		return self._warnings
+	warnings = property(fget=get_warnings)
+	
+	def set_stats(self, stats):
+		self._stats = stats
+	
+	def get_stats(self):
+		""" The stats.ParseStats of the parse, None when the VideoParser
+			doesn't collect them or the result came from a cache. """
+		return self._stats
+	stats = property(fget=get_stats)
 		
 	def new_video_stream(self, index=None):
 		stream = VideoStream()
@@ -84,9 +127,54 @@ class VideoFile(object):
 			if isinstance(self._streams[stream_id], AudioStream):
 				yield self._streams[stream_id]
 	audio_streams = property(fget=get_audio_streams)
+	
+	def to_dict(self):
+		""" Return the information as a dict of basic types, for example to
+			write it as JSON. """
+		streams = []
+		for stream_index in sorted(self._streams):
+			info = self._streams[stream_index].to_dict()
+			info['index'] = stream_index
+			streams.append(info)
+		
+		info = {
+			'container':	self._format,
+			'parse_time':	self._parse_time,
+			'streams':		streams,
+			'warnings':		[dict(warning) for warning in self._warnings],
+		}
+		if self._stats is not None:
+			info['stats'] = self._stats.to_dict()
+		return info
+
+
+class _Stream(object):
+	""" Base class of the streams, pickles only the attributes which differ
+		from a new stream to keep the results of VideoParser.parse_files
+		small."""
+	
+	def __getstate__(self):
+		defaults = self.__class__().__dict__
+		return dict((key, value) for key, value in self.__dict__.iteritems()
+					if key not in defaults or defaults[key] != value)
+	
+	def __setstate__(self, state):
+		self.__init__()
+		self.__dict__.update(state)
+	
+	def to_dict(self):
+		""" Return the information as a dict of basic types, durations are
+			in seconds. """
+		info = {}
+		for key, value in self.__dict__.iteritems():
+			if isinstance(value, datetime.timedelta):
+				value = value.days * 86400 + value.seconds + \
+						value.microseconds / 1000000.0
+			info[key.lstrip('_')] = value
+		return info
 
 
-class VideoStream(object):
+class VideoStream(_Stream):
 	""" Contains information from a video stream."""
 	def __init__(self):
 		self._duration = 0
@@ -220,7 +308,7 @@ class VideoStream(object):
 	duration = property(fget=get_duration)
 		
 	
-class AudioStream(object):
+class AudioStream(_Stream):
 	""" Contains information from a audio stream."""
 	def __init__(self):
 		self._channels = 0
@@ -231,13 +319,13 @@ class AudioStream(object):
 		self._bits_per_sample = 0
 		self.type = 'Audio'
 		self._trackID = 0
-		self._track_assignemnt = ''
+		self._track_assignment = ''
 
 	def set_track_id(self, num):
 		self._trackID = num
 	
 	def set_track_assignment(self, assign):
-		self._track_assignemnt = assign
+		self._track_assignment = assign
 	
 	def set_channels(self, num):
 		self._channels = num